@@ -1,16 +1,51 @@
+import time
+_BOOT_STARTED = time.perf_counter()  # origin of the startup timeline
 import asyncio
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import yt_dlp
 import re
 import random
+import itertools
 import aiohttp
-from typing import Optional
+from typing import Callable, Iterable, Optional
 import os
+import sys
+import math
+import json
+import sqlite3
+import threading
+import bisect
+import contextlib
+import hashlib
+import logging
+import multiprocessing
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from aiohttp import web
+from urllib.parse import urlparse, parse_qs, quote
+try:
+    import numpy as np
+except ImportError:  # optional, speeds up volume scaling
+    np = None
+try:
+    import audioop
+except ImportError:  # removed in Python 3.13; discord.py pulls in the audioop-lts backport there
+    audioop = None
 
 # --- Configuration --- #
 TOKEN = os.getenv("DISCORD_BOT_TOKEN")
+FORCE_SYNC = os.getenv("FORCE_SYNC", "0") == "1"  # sync slash commands even if they look unchanged
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.getenv("SHARD_COUNT") else None  # None: Discord's recommendation
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "1"))  # processes the shards are spread over
+SHARDED = SHARD_COUNT is not None or SHARD_WORKERS > 1 or os.getenv("SHARDED", "0") == "1"
+# Point the REST API (and with it the gateway URL lookup) somewhere else, e.g. an API proxy.
+if os.getenv("DISCORD_API_BASE"):
+    discord.http.Route.BASE = os.environ["DISCORD_API_BASE"]
+
+log = logging.getLogger("musicbot")
 
 intents = discord.Intents.default()
 intents.guilds = True
@@ -26,8 +61,161 @@ YTDL_FORMAT_OPTIONS = {
     "source_address": "0.0.0.0"
 }
 
-FFMPEG_OPTIONS = {"options": "-vn"}
-ytdl = yt_dlp.YoutubeDL(YTDL_FORMAT_OPTIONS)
+# Playlists are enumerated without resolving each entry; tracks are resolved when they come up to play.
+YTDL_FLAT_OPTIONS = {**YTDL_FORMAT_OPTIONS, "noplaylist": False, "extract_flat": "in_playlist", "lazy_playlist": True}
+
+FFMPEG_OPTIONS = {"before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5", "options": "-vn"}
+
+# name: (FFmpeg audio filter, playback rate). Normalization always runs last, after the other effects.
+AUDIO_EFFECTS = {
+    "normalize": ("loudnorm=I=-16:TP=-1.5:LRA=11", 1.0),
+    "bassboost": ("bass=g=10:f=110:w=0.6", 1.0),
+    "treble": ("treble=g=6:f=3000", 1.0),
+    "vocal": ("equalizer=f=250:t=q:w=1:g=-3,equalizer=f=2500:t=q:w=1:g=4", 1.0),
+    "nightcore": ("aresample=48000,asetrate=60000,aresample=48000", 1.25),
+    "vaporwave": ("aresample=48000,asetrate=38400,aresample=48000", 0.8),
+}
+RATE_EFFECTS = ("nightcore", "vaporwave")  # resample speed and pitch together; only one applies at a time
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_USE_PROCESSES = os.getenv("EXTRACT_USE_PROCESSES", "0") == "1"  # spread extraction over several cores
+EXTRACT_PER_GUILD_LIMIT = int(os.getenv("EXTRACT_PER_GUILD_LIMIT", "2"))  # concurrent extractions per guild
+EXTRACT_PER_GUILD_BACKLOG = int(os.getenv("EXTRACT_PER_GUILD_BACKLOG", "6"))  # waiting + running per guild
+EXTRACT_MAX_PENDING = int(os.getenv("EXTRACT_MAX_PENDING", "64"))  # waiting + running across all guilds
+PREFETCH_WINDOW = int(os.getenv("PREFETCH_WINDOW", "2"))  # upcoming tracks resolved ahead of time
+PLAYLIST_MAX_TRACKS = int(os.getenv("PLAYLIST_MAX_TRACKS", "500"))
+PLAYLIST_PAGE_SIZE = int(os.getenv("PLAYLIST_PAGE_SIZE", "100"))  # entries enumerated per extraction call
+PLAYLIST_FIRST_PAGE = 10  # small first page so playback starts before the rest is enumerated
+PLAYLIST_MAX_CONCURRENT = int(os.getenv("PLAYLIST_MAX_CONCURRENT", "4"))  # imports running at once, bot-wide
+IDLE_TIMEOUT = int(os.getenv("IDLE_TIMEOUT", "300"))  # seconds without playback before leaving voice
+REAPER_INTERVAL = int(os.getenv("REAPER_INTERVAL", "60"))
+SNAPSHOT_LIMIT = int(os.getenv("SNAPSHOT_LIMIT", "10000"))  # evicted guilds whose volume/loop settings are remembered
+FRAME_SECONDS = 0.02  # discord.py reads 20 ms of audio per frame
+FRAME_SAMPLES = 1920  # 16-bit samples per frame: 48 kHz * 20 ms * 2 channels
+OPUS_PASSTHROUGH = os.getenv("OPUS_PASSTHROUGH", "1") == "1"  # copy Opus streams without re-encoding at 100% volume
+VOLUME_BACKEND = os.getenv("VOLUME_BACKEND", "auto")  # auto, numpy or audioop
+GAPLESS_LEAD = float(os.getenv("GAPLESS_LEAD", "10"))  # seconds before a track ends to start the next FFmpeg
+
+CACHE_DIR = os.getenv("MUSIC_CACHE_DIR", ".musiccache")
+EXTRACT_CACHE_SIZE = int(os.getenv("EXTRACT_CACHE_SIZE", "512"))  # entries kept in memory
+EXTRACT_CACHE_TTL = int(os.getenv("EXTRACT_CACHE_TTL", "21600"))  # seconds, upper bound per entry
+EXTRACT_CACHE_PATH = os.getenv("EXTRACT_CACHE_PATH", os.path.join(CACHE_DIR, "cache.sqlite3"))  # "" disables disk tier
+AUDIO_CACHE_MB = int(os.getenv("AUDIO_CACHE_MB", "0"))  # on-disk Opus cache for repeated tracks; 0 disables it
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(CACHE_DIR, "audio"))
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("AUDIO_CACHE_MIN_PLAYS", "2"))  # plays before a track is cached (1 with loop on)
+AUDIO_CACHE_MAX_DURATION = int(os.getenv("AUDIO_CACHE_MAX_DURATION", "900"))  # seconds; longer tracks always stream
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))  # autocomplete searches kept in memory
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_RESULTS = 5  # YouTube results fetched per autocomplete search
+TITLE_INDEX_SIZE = int(os.getenv("TITLE_INDEX_SIZE", "5000"))  # recently seen tracks offered by /play autocomplete
+AUTOCOMPLETE_DEBOUNCE = float(os.getenv("AUTOCOMPLETE_DEBOUNCE", "0.4"))  # quiet time before searching YouTube
+AUTOCOMPLETE_TIMEOUT = 2.0  # Discord drops autocomplete answers after 3 seconds
+AUTOCOMPLETE_MIN_SEARCH = 3  # shorter input is only matched locally
+LYRICS_API_URL = os.getenv("LYRICS_API_URL", "https://api.lyrics.ovh")
+LYRICS_CACHE_SIZE = int(os.getenv("LYRICS_CACHE_SIZE", "256"))
+LYRICS_CACHE_TTL = int(os.getenv("LYRICS_CACHE_TTL", "86400"))
+LYRICS_NEGATIVE_TTL = int(os.getenv("LYRICS_NEGATIVE_TTL", "3600"))  # how long "no lyrics" answers are reused
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+# Lyrics share the SQLite file with the extraction cache, so every shard process on the host reuses them.
+LYRICS_CACHE_PATH = os.getenv("LYRICS_CACHE_PATH", EXTRACT_CACHE_PATH)  # "" disables disk tier
+# Queues and player settings are saved next to the caches so a restart can pick up where it left off.
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", EXTRACT_CACHE_PATH)  # "" disables session persistence
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "5"))  # seconds between batched writes
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", "86400"))  # saved sessions older than this are not restored
+SESSION_POSITION_STEP = 15  # seconds; a playing track's position is re-saved at this granularity
+SESSION_RESUME_CONCURRENCY = 5  # voice connections opened at once when resuming after a restart
+RATE_USER_BURST = int(os.getenv("RATE_USER_BURST", "6"))  # command tokens a user can spend at once
+RATE_USER_PER_SECOND = float(os.getenv("RATE_USER_PER_SECOND", "0.5"))  # tokens refilled per second
+RATE_GUILD_BURST = int(os.getenv("RATE_GUILD_BURST", "30"))
+RATE_GUILD_PER_SECOND = float(os.getenv("RATE_GUILD_PER_SECOND", "3"))
+COMMAND_COSTS = {"play": 3, "lyrics": 3, "seek": 2, "filter": 2, "speed": 2}  # tokens; other commands cost 1
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))  # seconds of event-loop lag before shedding load
+LOOP_LAG_INTERVAL = 0.1
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Prometheus endpoint; 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+STRUCTURED_LOGS = os.getenv("STRUCTURED_LOGS", "0") == "1"  # log playback events as JSON lines
+STREAM_EXPIRY_MARGIN = 300  # drop entries this many seconds before the signed stream URL expires
+# Only these fields of an info dict are cached; full dicts carry every format and thumbnail.
+CACHED_INFO_FIELDS = ("id", "title", "url", "webpage_url", "duration", "uploader", "acodec", "ext", "abr", "extractor_key")
+
+class ExtractionBusy(Exception):
+    """Raised when the extraction pool is saturated; the message is shown to the user."""
+
+def ffmpeg_options(start: float = 0, url: str = "", filters: Optional["FilterChain"] = None, gain: float = 1.0) -> dict:
+    """FFmpeg options for a stream starting at `start` seconds. Seeking before the input jumps by keyframe
+    instead of decoding and discarding everything up to the target."""
+    before = FFMPEG_OPTIONS["before_options"]
+    if url and not url.startswith(("http://", "https://")):
+        before = ""  # the reconnect flags belong to the HTTP protocol; local files reject them
+    if start > 0:
+        before = f"-ss {start:.3f} {before}".rstrip()
+    options = FFMPEG_OPTIONS["options"]
+    if filters:
+        options = f'{options} -af "{filters.graph(gain)}"'
+    elif gain != 1.0:
+        options = f'{options} -af "volume={gain:.3f}"'
+    return {"before_options": before, "options": options}
+
+class FilterChain:
+    """A guild's audio effects and speed, rendered as one FFmpeg -af graph. Immutable, so a source can be
+    compared with the guild's current chain to tell whether it needs restarting."""
+    __slots__ = ("effects", "speed")
+    def __init__(self, effects: Iterable[str] = (), speed: float = 1.0):
+        effects = set(effects)
+        self.effects = tuple(name for name in AUDIO_EFFECTS if name in effects)
+        self.speed = speed
+    def __bool__(self):
+        return bool(self.effects) or self.speed != 1.0
+    def __eq__(self, other):
+        return isinstance(other, FilterChain) and (self.effects, self.speed) == (other.effects, other.speed)
+    def __hash__(self):
+        return hash((self.effects, self.speed))
+    @property
+    def rate(self) -> float:
+        """Seconds of the track played per second of audio sent."""
+        rate = self.speed
+        for name in self.effects:
+            rate *= AUDIO_EFFECTS[name][1]
+        return rate
+    def toggle(self, name: str) -> "FilterChain":
+        if name in self.effects:
+            return FilterChain([e for e in self.effects if e != name], self.speed)
+        effects = [e for e in self.effects if not (name in RATE_EFFECTS and e in RATE_EFFECTS)]
+        return FilterChain(effects + [name], self.speed)
+    def with_speed(self, speed: float) -> "FilterChain":
+        return FilterChain(self.effects, speed)
+    def graph(self, gain: float = 1.0) -> str:
+        parts = [AUDIO_EFFECTS[name][0] for name in self.effects if name != "normalize"]
+        if self.speed != 1.0:
+            parts.append(f"atempo={self.speed:g}")  # tempo only; pitch is kept
+        if "normalize" in self.effects:
+            parts.append(AUDIO_EFFECTS["normalize"][0])
+        if gain != 1.0:
+            parts.append(f"volume={gain:.3f}")
+        parts.append("aresample=48000")  # loudnorm works at 192 kHz; Discord wants 48 kHz
+        return ",".join(parts)
+    def describe(self) -> str:
+        names = list(self.effects)
+        if self.speed != 1.0:
+            names.append(f"speed {self.speed:g}x")
+        return ", ".join(names) or "none"
+
+NO_FILTERS = FilterChain()
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User plus system CPU time of a process, read from /proc (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return None
+
+def format_duration(duration: int):
+    hours, remainder = divmod(int(duration), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
 
 def time_to_seconds(time: str) -> int:
     """Convert mm:ss or hh:mm:ss or '90' (seconds) to total seconds."""
@@ -39,10 +227,775 @@ def time_to_seconds(time: str) -> int:
         seconds = seconds * 60 + p
     return seconds
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
-        super().__init__(source, volume)
+# --- Metrics --- #
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+GAP_BUCKETS = (0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in self._values.items():
+                yield f"{self.name}{_format_labels(labels)} {value}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            for labels, series in self._series.items():
+                for bound, count in zip(self.buckets, series):
+                    yield f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {count}"
+                yield f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series[-1]}"
+                yield f"{self.name}_sum{_format_labels(labels)} {series[-2]}"
+                yield f"{self.name}_count{_format_labels(labels)} {series[-1]}"
+
+class Metrics:
+    """Process-wide metrics registry, rendered in the Prometheus text format. Gauges are produced at scrape
+    time by collector callbacks returning (name, help, [(labels, value), ...]) tuples."""
+    def __init__(self):
+        self.extraction = Histogram("musicbot_extraction_seconds", "yt_dlp extraction time in a worker")
+        self.ffmpeg_spawn = Histogram("musicbot_ffmpeg_spawn_seconds", "Time to start an FFmpeg source")
+        self.queue_wait = Histogram("musicbot_queue_wait_seconds", "Time a song waited in the queue before playing")
+        self.time_to_first_audio = Histogram("musicbot_time_to_first_audio_seconds",
+                                             "From /play on an idle player to audio starting")
+        self.transition_gap = Histogram("musicbot_track_transition_gap_seconds",
+                                        "Silence between the end of one queued track and the start of the next", GAP_BUCKETS)
+        self.command = Histogram("musicbot_command_seconds", "Slash command handler time")
+        self.ffmpeg_failures = Counter("musicbot_ffmpeg_failures_total", "FFmpeg sources that failed to start or errored")
+        self.load_failures = Counter("musicbot_track_load_failures_total", "Queued songs that could not be resolved")
+        self.rejected = Counter("musicbot_commands_rejected_total", "Commands refused by rate limits or load shedding")
+        self._collectors: list[Callable] = []
+    def add_collector(self, collector: Callable):
+        self._collectors.append(collector)
+    def remove_collector(self, collector: Callable):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+    def render(self) -> str:
+        lines = []
+        for metric in (self.extraction, self.ffmpeg_spawn, self.queue_wait, self.time_to_first_audio,
+                       self.transition_gap, self.command, self.ffmpeg_failures, self.load_failures, self.rejected):
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            for name, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{_format_labels(tuple(labels.items()))} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+    def event(self, name: str, **fields):
+        if STRUCTURED_LOGS:
+            log.info(json.dumps({"event": name, "ts": round(time.time(), 3), **fields}, default=str))
+    async def start_server(self, host: str, port: int) -> web.AppRunner:
+        async def handle(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+metrics = Metrics()
+
+# --- Extraction cache --- #
+class TTLCache:
+    """In-memory LRU cache where every entry carries its own expiry timestamp."""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+    def get(self, key, now: Optional[float] = None):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires <= (now if now is not None else time.time()):
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+    def set(self, key, value, expires: float):
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    def pop(self, key):
+        item = self._data.pop(key, None)
+        return item[0] if item else None
+    def clear(self):
+        self._data.clear()
+    def __len__(self):
+        return len(self._data)
+
+class SqliteStore:
+    """JSON key/value table in SQLite with per-row expiry. Safe to share between threads. Coroutines use
+    aget() and the *_later() writes, which run on the store's own thread: shard processes share the file,
+    and waiting on another process's write lock must never stall the event loop."""
+    def __init__(self, path: str, table: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.table = table
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-{table}")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL lets several shard processes read and write the same file concurrently.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)")
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= time.time():
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+        return json.loads(row[0]), row[1]
+    def set(self, key: str, value, expires: float):
+        with self._lock:
+            self._conn.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                               (key, json.dumps(value), expires))
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (time.time(),))
+    async def aget(self, key: str):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, key)
+    def set_later(self, key: str, value, expires: float):
+        """Write behind: queue the write on the store's thread and return at once."""
+        self._executor.submit(self._logged, self.set, key, value, expires)
+    def delete_later(self, key: str):
+        self._executor.submit(self._logged, self.delete, key)
+    def _logged(self, func, *args):
+        try:
+            func(*args)
+        except sqlite3.Error as e:
+            log.warning("SQLite write to %s failed: %s", self.table, e)
+    def close(self):
+        self._executor.shutdown(wait=True)  # finish queued writes
+    def set_many(self, items: Iterable[tuple[str, object]], expires: float):
+        self._write_many(f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                         [(key, json.dumps(value), expires) for key, value in items])
+    def delete_many(self, keys: Iterable[str]):
+        self._write_many(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys])
+    def _write_many(self, sql: str, rows: list[tuple]):
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")  # one transaction, so a batch costs a single WAL sync
+            try:
+                self._conn.executemany(sql, rows)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+    def items(self) -> list[tuple[str, object]]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key, value FROM {self.table} WHERE expires > ?", (time.time(),)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+async def coalesced(inflight: dict, key, factory):
+    """Await factory() at most once per key at a time; concurrent callers with the same key share the result.
+    The work runs as its own task, so cancelling one caller (/leave, eviction) doesn't cancel it for the rest."""
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        inflight[key] = task
+        def done(t):
+            if inflight.get(key) is t:
+                del inflight[key]
+            if not t.cancelled():
+                t.exception()  # retrieved even when every caller has gone
+        task.add_done_callback(done)
+    return await asyncio.shield(task)
+
+def is_playlist_url(query: str) -> bool:
+    parsed = urlparse(query.strip())
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return False
+    params = parse_qs(parsed.query)
+    return "list" in params and ("v" not in params or parsed.path.startswith("/playlist"))
+
+def normalize_query(query: str) -> str:
+    """Cache key for a /play query: YouTube URLs collapse to their video ID, searches are case-folded."""
+    query = query.strip()
+    parsed = urlparse(query)
+    if parsed.scheme in ("http", "https") and parsed.netloc:
+        host = parsed.netloc.lower().split(":")[0]
+        if host.endswith("youtu.be"):
+            video_id = parsed.path.lstrip("/").split("/")[0]
+        elif host.endswith("youtube.com"):
+            video_id = parse_qs(parsed.query).get("v", [None])[0]
+            if video_id is None and parsed.path.startswith(("/shorts/", "/live/")):
+                video_id = parsed.path.split("/")[2]
+        else:
+            video_id = None
+        if video_id:
+            return f"yt:{video_id}"
+        return "url:" + parsed._replace(fragment="").geturl()
+    return "q:" + " ".join(query.lower().split())
+
+def stream_url_expiry(url: Optional[str]) -> Optional[float]:
+    """Expiry timestamp embedded in a signed googlevideo stream URL, if any."""
+    if not url:
+        return None
+    parsed = urlparse(url)
+    expire = parse_qs(parsed.query).get("expire", [None])[0]
+    if expire is None and "/expire/" in parsed.path:
+        expire = parsed.path.split("/expire/", 1)[1].split("/", 1)[0]
+    try:
+        return float(expire) if expire else None
+    except ValueError:
+        return None
+
+def slim_info(data: dict) -> dict:
+    return {k: data[k] for k in CACHED_INFO_FIELDS if data.get(k) is not None}
+
+class ExtractionCache:
+    """Two-tier cache of extracted track info: an in-memory LRU in front of an SQLite table."""
+    def __init__(self, maxsize: int, ttl: int, path: Optional[str] = None):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize)
+        self.disk = SqliteStore(path, "extract_cache") if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    async def get(self, query: str) -> Optional[dict]:
+        key = normalize_query(query)
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            row = await self.disk.aget(key)
+            if row is not None:
+                data, expires = row
+                self.memory.set(key, data, expires)
+                self.disk_hits += 1
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+    def put(self, query: str, data: dict) -> dict:
+        data = slim_info(data)
+        expires = time.time() + self.ttl
+        url_expiry = stream_url_expiry(data.get("url"))
+        if url_expiry is not None:
+            expires = min(expires, url_expiry - STREAM_EXPIRY_MARGIN)
+        if expires <= time.time():
+            return data
+        keys = {normalize_query(query)}
+        if data.get("webpage_url"):
+            keys.add(normalize_query(data["webpage_url"]))
+        for key in keys:
+            self.memory.set(key, data, expires)
+            if self.disk is not None:
+                self.disk.set_later(key, data, expires)
+        return data
+    def invalidate(self, query: str):
+        key = normalize_query(query)
+        self.memory.pop(key)
+        if self.disk is not None:
+            self.disk.delete_later(key)
+    def stats(self) -> dict:
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "size": len(self.memory)}
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+extraction_cache = ExtractionCache(EXTRACT_CACHE_SIZE, EXTRACT_CACHE_TTL, EXTRACT_CACHE_PATH or None)
+
+# --- Title index --- #
+class TitleIndex:
+    """Prefix index over recently played and searched titles for /play autocomplete. Every word of a title
+    starts a key, so "bohemian" and "queen boh" both find "Queen - Bohemian Rhapsody"."""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict[str, tuple[str, str, int]] = OrderedDict()  # video id -> (title, url, stamp)
+        self._keys: list[tuple[str, str]] = []  # sorted (title suffix, video id)
+        self._clock = 0
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(re.sub(r"[^\w]+", " ", text.casefold()).split())
+    def _suffixes(self, title: str) -> set[str]:
+        words = self.normalize(title).split()[:12]
+        return {" ".join(words[i:]) for i in range(len(words))}
+    def add(self, video_id: Optional[str], title: Optional[str], url: Optional[str]):
+        if not video_id or not title or not url:
+            return
+        self._clock += 1
+        if video_id in self.entries:
+            title, url, _ = self.entries[video_id]
+            self.entries[video_id] = (title, url, self._clock)
+            self.entries.move_to_end(video_id)
+            return
+        self.entries[video_id] = (title, url, self._clock)
+        for key in self._suffixes(title):
+            bisect.insort(self._keys, (key, video_id))
+        while len(self.entries) > self.maxsize:
+            old_id, (old_title, _, _) = self.entries.popitem(last=False)
+            for key in self._suffixes(old_title):
+                i = bisect.bisect_left(self._keys, (key, old_id))
+                if i < len(self._keys) and self._keys[i] == (key, old_id):
+                    del self._keys[i]
+    def add_info(self, data: dict):
+        self.add(data.get("id"), data.get("title"), data.get("webpage_url") or data.get("url"))
+    def search(self, text: str, limit: int = 25) -> list[tuple[str, str]]:
+        """(title, url) pairs whose title has a word sequence starting with `text`, most recent first."""
+        prefix = self.normalize(text)
+        if not prefix:
+            return [(title, url) for title, url, _ in itertools.islice(reversed(self.entries.values()), limit)]
+        found = set()
+        i = bisect.bisect_left(self._keys, (prefix,))
+        while i < len(self._keys) and self._keys[i][0].startswith(prefix):
+            found.add(self._keys[i][1])
+            i += 1
+        ranked = sorted((self.entries[video_id] for video_id in found), key=lambda entry: entry[2], reverse=True)
+        return [(title, url) for title, url, _ in ranked[:limit]]
+    def __len__(self):
+        return len(self.entries)
+
+title_index = TitleIndex(TITLE_INDEX_SIZE)
+
+# --- Extraction workers --- #
+_worker_local = threading.local()
+
+def _worker_ytdl() -> yt_dlp.YoutubeDL:
+    """The YoutubeDL instance owned by the calling worker thread or process."""
+    ydl = getattr(_worker_local, "ytdl", None)
+    if ydl is None:
+        ydl = _worker_local.ytdl = yt_dlp.YoutubeDL(YTDL_FORMAT_OPTIONS)
+    return ydl
+
+def _worker_flat_ytdl() -> yt_dlp.YoutubeDL:
+    ydl = getattr(_worker_local, "flat_ytdl", None)
+    if ydl is None:
+        ydl = _worker_local.flat_ytdl = yt_dlp.YoutubeDL(YTDL_FLAT_OPTIONS)
+    return ydl
+
+def _playlist_page_in_worker(url: str, start: int, end: int) -> list[dict]:
+    """Flat-extract playlist entries start..end (1-based, inclusive)."""
+    ydl = _worker_flat_ytdl()
+    ydl.params["playliststart"] = start
+    ydl.params["playlistend"] = end
+    data = ydl.extract_info(url, download=False)
+    if data is None:
+        raise ValueError("Could not retrieve playlist.")
+    return [slim_info(entry) for entry in data.get("entries") or () if entry]
+
+def _search_in_worker(query: str, limit: int) -> list[dict]:
+    """Flat YouTube search: ids and titles only, no format extraction."""
+    ydl = _worker_flat_ytdl()
+    ydl.params["playliststart"] = 1
+    ydl.params["playlistend"] = limit
+    data = ydl.extract_info(f"ytsearch{limit}:{query}", download=False)
+    return [slim_info(entry) for entry in (data or {}).get("entries") or () if entry]
+
+def _extract_in_worker(query: str, download: bool = False) -> dict:
+    data = _worker_ytdl().extract_info(query, download=download)
+    if data is None:
+        raise ValueError("Could not retrieve data.")
+    if "entries" in data:
+        data = next(iter(data["entries"]), None)
+        if data is None:
+            raise ValueError("No video data.")
+    # Keep results small: they cross a process boundary in process-pool mode.
+    return data if download else slim_info(data)
+
+class ExtractionEngine:
+    """Dedicated, bounded pool for yt_dlp extraction with per-guild fairness and in-flight deduplication."""
+    def __init__(self, workers: int, *, use_processes: bool = False, per_guild_limit: int = 2,
+                 per_guild_backlog: int = 6, max_pending: int = 64, cache: Optional[ExtractionCache] = None,
+                 index: Optional[TitleIndex] = None):
+        if use_processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ytdl")
+        self.cache = cache
+        self.index = index  # learns every title extracted or searched, for autocomplete
+        self.search_cache = TTLCache(SEARCH_CACHE_SIZE)
+        self.per_guild_limit = per_guild_limit
+        self.per_guild_backlog = per_guild_backlog
+        self.max_pending = max_pending
+        self.pending = 0
+        self._guild_pending: dict[Optional[int], int] = {}
+        self._guild_slots: dict[Optional[int], asyncio.Semaphore] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._playlist_slots = asyncio.Semaphore(PLAYLIST_MAX_CONCURRENT)
+    async def extract(self, query: str, *, guild_id: Optional[int] = None) -> dict:
+        if self.cache is not None:
+            data = await self.cache.get(query)
+            if data is not None:
+                return data
+        return await coalesced(self._inflight, normalize_query(query), lambda: self._extract(query, guild_id))
+    async def _extract(self, query: str, guild_id: Optional[int]) -> dict:
+        self._check_capacity(guild_id)
+        loop = asyncio.get_running_loop()
+        self._acquire(guild_id)
+        try:
+            async with self._guild_slots[guild_id]:
+                started = time.perf_counter()
+                data = await loop.run_in_executor(self.executor, _extract_in_worker, query)
+                metrics.extraction.observe(time.perf_counter() - started)
+        finally:
+            self._release(guild_id)
+        if self.cache is not None:
+            data = self.cache.put(query, data)
+        if self.index is not None:
+            self.index.add_info(data)
+        return data
+    def cached_search(self, query: str) -> Optional[list[dict]]:
+        return self.search_cache.get(normalize_query(query))
+    async def search(self, query: str, *, guild_id: Optional[int] = None, limit: int = SEARCH_RESULTS) -> list[dict]:
+        """Flat search results (id, title, url) for a free-text query, cached and deduplicated by query."""
+        key = normalize_query(query)
+        results = self.search_cache.get(key)
+        if results is not None:
+            return results
+        return await coalesced(self._inflight, "search:" + key, lambda: self._search(query, key, guild_id, limit))
+    async def _search(self, query: str, key: str, guild_id: Optional[int], limit: int) -> list[dict]:
+        self._check_capacity(guild_id)
+        loop = asyncio.get_running_loop()
+        self._acquire(guild_id)
+        try:
+            async with self._guild_slots[guild_id]:
+                results = await loop.run_in_executor(self.executor, _search_in_worker, query, limit)
+        finally:
+            self._release(guild_id)
+        self.search_cache.set(key, results, time.time() + SEARCH_CACHE_TTL)
+        if self.index is not None:
+            for entry in reversed(results):  # the top hit ends up most recent, so it is suggested first
+                self.index.add_info(entry)
+        return results
+    async def iter_playlist(self, url: str, *, guild_id: Optional[int] = None, limit: int = PLAYLIST_MAX_TRACKS):
+        """Yield flat playlist entries a page at a time, so the first tracks can play while the rest load."""
+        loop = asyncio.get_running_loop()
+        start, page_size = 1, PLAYLIST_FIRST_PAGE
+        async with self._playlist_slots:
+            while start <= limit:
+                end = min(start + page_size - 1, limit)
+                self._check_capacity(guild_id)
+                self._acquire(guild_id)
+                try:
+                    async with self._guild_slots[guild_id]:
+                        entries = await loop.run_in_executor(self.executor, _playlist_page_in_worker, url, start, end)
+                finally:
+                    self._release(guild_id)
+                for entry in entries:
+                    if self.index is not None:
+                        self.index.add_info(entry)
+                    yield entry
+                if len(entries) < end - start + 1:
+                    return
+                start, page_size = end + 1, PLAYLIST_PAGE_SIZE
+    async def download(self, query: str) -> dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _extract_in_worker, query, True)
+    def _check_capacity(self, guild_id):
+        if self.pending >= self.max_pending:
+            raise ExtractionBusy("The bot is busy loading other songs, try again in a moment.")
+        if self._guild_pending.get(guild_id, 0) >= self.per_guild_backlog:
+            raise ExtractionBusy("Too many songs are already loading for this server, try again in a moment.")
+    def _acquire(self, guild_id):
+        self.pending += 1
+        self._guild_pending[guild_id] = self._guild_pending.get(guild_id, 0) + 1
+        if guild_id not in self._guild_slots:
+            self._guild_slots[guild_id] = asyncio.Semaphore(self.per_guild_limit)
+    def _release(self, guild_id):
+        self.pending -= 1
+        self._guild_pending[guild_id] -= 1
+        if self._guild_pending[guild_id] == 0:
+            del self._guild_pending[guild_id]
+            del self._guild_slots[guild_id]
+    def stats(self) -> dict:
+        return {"pending": self.pending, "inflight": len(self._inflight), "guilds": len(self._guild_pending)}
+    def collect_metrics(self):
+        cache = self.cache.stats() if self.cache is not None else {}
+        yield "musicbot_extraction_pending", "Extractions waiting or running", [({}, self.pending)]
+        yield "musicbot_extract_cache_hits", "Extraction cache hits (memory or disk)", [({}, cache.get("hits", 0))]
+        yield "musicbot_extract_cache_disk_hits", "Extraction cache hits served from SQLite", [({}, cache.get("disk_hits", 0))]
+        yield "musicbot_extract_cache_misses", "Extraction cache misses", [({}, cache.get("misses", 0))]
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+extraction_engine = ExtractionEngine(EXTRACT_WORKERS, use_processes=EXTRACT_USE_PROCESSES,
+                                     per_guild_limit=EXTRACT_PER_GUILD_LIMIT, per_guild_backlog=EXTRACT_PER_GUILD_BACKLOG,
+                                     max_pending=EXTRACT_MAX_PENDING, cache=extraction_cache, index=title_index)
+metrics.add_collector(extraction_engine.collect_metrics)
+
+# --- Audio cache --- #
+class AudioCache:
+    """Size-bounded LRU of Opus files keyed by video ID. A track is copied to disk in the background once it
+    has been played `min_plays` times, and later plays and seeks read the local file instead of YouTube.
+    File mtimes hold the LRU order, so it survives restarts and is shared by shard processes. The size bound
+    is enforced on the directory as a whole: eviction re-scans it, counting files other processes fetched."""
+    def __init__(self, directory: str, max_bytes: int, *, min_plays: int = 2, max_duration: int = 900,
+                 fetches: int = 2):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.max_duration = max_duration
+        self.entries: OrderedDict[str, int] = OrderedDict()  # video id -> file size, least recently used first
+        self.size = 0
+        self.plays = TTLCache(4096)  # video id -> plays while not cached
+        self.hits = 0
+        self.misses = 0
+        self.fetch_failures = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._fetch_slots = asyncio.Semaphore(fetches)
+        self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audio-cache")
+        self.entries, self.size = self._scan(clean=True)
+    def _scan(self, *, clean: bool = False) -> tuple[OrderedDict, int]:
+        """Files and total size as found on disk, after evicting least recently used files until it fits."""
+        found = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith(".part") and clean:
+                    os.remove(path)  # left behind by a fetch that never finished
+                elif name.endswith(".opus"):
+                    st = os.stat(path)
+                    found.append((st.st_mtime, name[:-5], st.st_size))
+            except FileNotFoundError:
+                pass  # evicted by another shard process meanwhile
+        entries: OrderedDict[str, int] = OrderedDict()
+        total = sum(size for _, _, size in found)
+        for _, video_id, size in sorted(found):
+            if total > self.max_bytes:
+                total -= size
+                self._discard(self.path(video_id))  # a file still open in FFmpeg keeps playing after it is unlinked
+            else:
+                entries[video_id] = size
+        return entries, total
+    def path(self, video_id: str) -> str:
+        return os.path.join(self.directory, f"{video_id}.opus")
+    @staticmethod
+    def cacheable(video_id: Optional[str]) -> bool:
+        return bool(video_id) and re.fullmatch(r"[\w-]+", video_id) is not None
+    async def lookup(self, video_id: Optional[str]) -> Optional[str]:
+        """Path of the cached file for `video_id`, or None. Marks the entry as recently used."""
+        if not self.cacheable(video_id):
+            return None
+        path = self.path(video_id)
+        size = await asyncio.get_running_loop().run_in_executor(self._disk, self._touch, path)
+        if size is None:
+            if video_id in self.entries:
+                self.size -= self.entries.pop(video_id)  # evicted by another shard process
+            self.misses += 1
+            return None
+        self.size += size - self.entries.pop(video_id, 0)  # possibly fetched by another shard process
+        self.entries[video_id] = size
+        self.hits += 1
+        return path
+    @staticmethod
+    def _touch(path: str) -> Optional[int]:
+        try:
+            os.utime(path)
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+    def note_play(self, video_id: Optional[str], duration: Optional[float], looping: bool = False) -> bool:
+        """Count a streamed play; True when the track has become hot enough to fetch."""
+        if not self.cacheable(video_id) or video_id in self.entries or video_id in self._inflight:
+            return False
+        if not duration or duration > self.max_duration:
+            return False
+        plays = (self.plays.get(video_id) or 0) + 1
+        self.plays.set(video_id, plays, math.inf)
+        return looping or plays >= self.min_plays
+    async def fetch(self, video_id: str, data: dict) -> bool:
+        return await coalesced(self._inflight, video_id, lambda: self._fetch(video_id, data))
+    async def _fetch(self, video_id: str, data: dict) -> bool:
+        path = self.path(video_id)
+        part = f"{path}.{os.getpid()}.part"
+        # Opus streams are copied as-is; anything else is encoded once so cached plays can use passthrough.
+        codec = ["-c:a", "copy"] if data.get("acodec") == "opus" else ["-c:a", "libopus", "-b:a", "128k"]
+        async with self._fetch_slots:
+            process = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-y", *ffmpeg_options(0, data["url"])["before_options"].split(),
+                "-i", data["url"], "-vn", *codec, "-f", "ogg", part,
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                self._discard(part)
+                raise
+        if process.returncode != 0:
+            self.fetch_failures += 1
+            self._discard(part)
+            log.warning("Could not cache audio for %s: %s", video_id, stderr.decode(errors="replace").strip()[-200:])
+            return False
+        loop = asyncio.get_running_loop()
+        self.entries, self.size = await loop.run_in_executor(self._disk, self._store, part, path)
+        self.plays.pop(video_id)
+        return True
+    def _store(self, part: str, path: str) -> tuple[OrderedDict, int]:
+        os.replace(part, path)
+        return self._scan()
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    def stats(self) -> dict:
+        return {"files": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses,
+                "fetching": len(self._inflight), "fetch_failures": self.fetch_failures}
+    def collect_metrics(self):
+        stats = self.stats()
+        yield "musicbot_audio_cache_bytes", "Bytes of Opus audio in the local cache", [({}, stats["bytes"])]
+        yield "musicbot_audio_cache_files", "Tracks in the local audio cache", [({}, stats["files"])]
+        yield "musicbot_audio_cache_hits", "Plays served from the local audio cache", [({}, stats["hits"])]
+        yield "musicbot_audio_cache_misses", "Cache lookups that had to stream", [({}, stats["misses"])]
+        yield "musicbot_audio_cache_fetch_failures", "Failed background copies into the audio cache", \
+            [({}, stats["fetch_failures"])]
+
+audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MB * 1024 * 1024, min_plays=AUDIO_CACHE_MIN_PLAYS,
+                         max_duration=AUDIO_CACHE_MAX_DURATION) if AUDIO_CACHE_MB > 0 else None
+if audio_cache is not None:
+    metrics.add_collector(audio_cache.collect_metrics)
+
+# --- Lyrics --- #
+class LyricsProvider(ABC):
+    """Lyrics lookup backend. Subclass and implement `fetch` to use another API."""
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+    @abstractmethod
+    async def fetch(self, session: aiohttp.ClientSession, artist: str, title: str) -> str:
+        """Return the lyrics, or "" when the provider has none. Raise on transient failures."""
+
+class LyricsOvhProvider(LyricsProvider):
+    async def fetch(self, session: aiohttp.ClientSession, artist: str, title: str) -> str:
+        url = f"{self.base_url}/v1/{quote(artist, safe='')}/{quote(title, safe='')}"
+        async with session.get(url) as resp:
+            if resp.status == 404:
+                return ""
+            resp.raise_for_status()
+            data = await resp.json()
+        return (data.get("lyrics") or "").strip()
+
+class LyricsService:
+    """Caches provider answers (including "no lyrics") and coalesces identical concurrent lookups."""
+    def __init__(self, provider: LyricsProvider, *, maxsize: int, ttl: int, negative_ttl: int,
+                 path: Optional[str] = None):
+        self.provider = provider
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize)
+        self.disk = SqliteStore(path, "lyrics_cache") if path else None
+        self.hits = 0
+        self.misses = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+    async def get(self, session: aiohttp.ClientSession, artist: str, title: str) -> str:
+        key = f"{artist.lower()}\n{title.lower()}"
+        lyrics = self.cache.get(key)
+        if lyrics is None and self.disk is not None:
+            row = await self.disk.aget(key)
+            if row is not None:
+                lyrics, expires = row
+                self.cache.set(key, lyrics, expires)
+        if lyrics is not None:
+            self.hits += 1
+            return lyrics
+        self.misses += 1
+        return await coalesced(self._inflight, key, lambda: self._fetch(session, key, artist, title))
+    async def _fetch(self, session: aiohttp.ClientSession, key: str, artist: str, title: str) -> str:
+        lyrics = await self.provider.fetch(session, artist, title)
+        expires = time.time() + (self.ttl if lyrics else self.negative_ttl)
+        self.cache.set(key, lyrics, expires)
+        if self.disk is not None:
+            self.disk.set_later(key, lyrics, expires)
+        return lyrics
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+def extract_artist(title: Optional[str], uploader: Optional[str]) -> Optional[str]:
+    if title and "-" in title:
+        return title.split("-")[0].strip()
+    return uploader
+
+def wants_passthrough(data: dict, volume: float, filters: FilterChain = NO_FILTERS) -> bool:
+    """Opus streams played at full volume without filters can be copied to Discord as-is, skipping decode
+    and re-encode."""
+    return OPUS_PASSTHROUGH and volume == 1.0 and not filters and data.get("acodec") == "opus"
+
+class PCMScaler:
+    """Applies a gain to 16-bit PCM frames. At full volume frames pass through untouched, which is where
+    the saving is: scaling itself costs about what PCMVolumeTransformer does (benchmarks/volume.py)."""
+    def __init__(self, backend: str = VOLUME_BACKEND):
+        if backend == "auto":
+            backend = "numpy" if np is not None else "audioop"
+        if backend not in ("numpy", "audioop") or (backend == "numpy" and np is None) \
+                or (backend == "audioop" and audioop is None):
+            raise RuntimeError(f"Volume backend '{backend}' is not available.")
+        self.backend = backend
+        self._scale = getattr(self, f"_scale_{backend}")
+        if backend == "numpy":
+            self._work = np.empty(FRAME_SAMPLES, dtype=np.int32)
+            self._out = np.empty(FRAME_SAMPLES, dtype="<i2")
+    def scale(self, frame: bytes, volume: float) -> bytes:
+        if volume == 1.0 or not frame:
+            return frame
+        return self._scale(frame, volume)
+    def _scale_numpy(self, frame: bytes, volume: float) -> bytes:
+        samples = np.frombuffer(frame, dtype="<i2")
+        if samples.size != FRAME_SAMPLES or volume > 1.0:
+            return np.clip(samples * volume, -32768, 32767).astype("<i2").tobytes()
+        # Q16 fixed point: gains up to 1.0 cannot overflow int32 and need no clipping.
+        np.multiply(samples, int(volume * 65536), out=self._work, dtype=np.int32)
+        np.right_shift(self._work, 16, out=self._work)
+        np.copyto(self._out, self._work, casting="unsafe")
+        return self._out.tobytes()
+    def _scale_audioop(self, frame: bytes, volume: float) -> bytes:
+        return audioop.mul(frame, 2, min(volume, 2.0))
+
+class YTDLSource(discord.AudioSource):
+    def __init__(self, source, *, data, volume=0.5, start: float = 0.0, filters: FilterChain = NO_FILTERS,
+                 gain: float = 1.0):
+        self.original = source
+        self.passthrough = source.is_opus()  # packets go to Discord untouched; volume is fixed at 100%
+        self.volume = volume  # read once per frame, so changes apply at the next frame boundary
+        self.scaler = None if self.passthrough else PCMScaler()
         self.data = data
+        self.start = start  # stream offset the FFmpeg process was started at
+        self.filters = filters
+        self.gain = gain  # volume already applied by FFmpeg
+        self.frames = 0
+        self.spawned_at = time.monotonic()
         self.title = data.get("title")
         self.url = data.get("url")
         self.webpage_url = data.get("webpage_url")
@@ -51,75 +1004,454 @@ class YTDLSource(discord.PCMVolumeTransformer):
         self.artist = None
         self.extract_artist()
     def extract_artist(self):
-        if self.title and "-" in self.title:
-            parts = self.title.split("-")
-            if len(parts) >= 2:
-                self.artist = parts[0].strip()
+        self.artist = extract_artist(self.title, self.uploader)
+    @property
+    def volume(self) -> float:
+        return self._volume
+    @volume.setter
+    def volume(self, value: float):
+        self._volume = max(value, 0.0)
+    def read(self):
+        data = self.original.read()
+        if data:
+            self.frames += 1
+        if self.passthrough:
+            return data
+        # Equal to 1.0 (and free) until the volume is turned down from what FFmpeg applies.
+        return self.scaler.scale(data, self._volume / self.gain)
+    def is_opus(self):
+        return self.passthrough
+    def cleanup(self):
+        self.original.cleanup()
+    @property
+    def position(self) -> float:
+        """Seconds into the track that have been handed to the voice client."""
+        return self.start + self.frames * FRAME_SECONDS * self.filters.rate
+    def ffmpeg_cpu_percent(self) -> Optional[float]:
+        """CPU used by this source's FFmpeg since it started, as a percentage of one core."""
+        process = getattr(self.original, "_process", None)
+        cpu = process_cpu_seconds(process.pid) if process is not None else None
+        elapsed = time.monotonic() - self.spawned_at
+        if cpu is None or elapsed <= 0:
+            return None
+        return 100 * cpu / elapsed
+    @classmethod
+    async def from_url(cls, url: str, *, loop=None, stream=True, volume=0.5, guild_id: Optional[int] = None,
+                       start: float = 0.0, filters: FilterChain = NO_FILTERS):
+        if stream:
+            data = await extraction_engine.extract(url, guild_id=guild_id)
         else:
-            self.artist = self.uploader
+            data = await extraction_engine.download(url)
+        url2 = data["url"] if stream else data["requested_download"]
+        return cls.open(url2, data=data, volume=volume, start=start, filters=filters)
+    @classmethod
+    async def for_song(cls, song: "Song", *, volume=0.5, guild_id: Optional[int] = None, start: float = 0.0,
+                       filters: FilterChain = NO_FILTERS):
+        """Open a queued song, from the local audio cache when it holds the track, otherwise from its stream."""
+        path = await audio_cache.lookup(song.video_id) if audio_cache is not None else None
+        if path is None:
+            return await cls.from_url(song.webpage_url, stream=True, volume=volume, guild_id=guild_id, start=start,
+                                      filters=filters)
+        data = {"id": song.video_id, "title": song.title(), "duration": song.duration(),
+                "webpage_url": song.webpage_url, "url": path, "acodec": "opus"}
+        return cls.open(path, data=data, volume=volume, start=start, filters=filters)
     @classmethod
-    async def from_url(cls, url: str, *, loop=None, stream=True, volume=0.5):
-        loop = loop or asyncio.get_event_loop()
+    def open(cls, url2: str, *, data: dict, volume=0.5, start: float = 0.0, filters: FilterChain = NO_FILTERS):
+        # FFmpeg applies the volume while decoding, so frames only go through PCMScaler after a live change.
+        gain = volume if volume > 0 else 1.0
+        started = time.perf_counter()
         try:
-            data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
-        except Exception as ex:
-            raise ex
-        if data is None:
-            raise ValueError("Could not retrieve data.")
-        if "entries" in data:
-            data = data["entries"][0]
-            if data is None:
-                raise ValueError("No video data.")
-        url2 = data["url"] if stream else data["requested_download"]
-        source = discord.FFmpegPCMAudio(url2, **FFMPEG_OPTIONS)
-        return cls(source, data=data, volume=volume)
+            if wants_passthrough(data, volume, filters):
+                source = discord.FFmpegOpusAudio(url2, codec="copy", **ffmpeg_options(start, url2))
+            else:
+                source = discord.FFmpegPCMAudio(url2, **ffmpeg_options(start, url2, filters, gain))
+        except Exception:
+            metrics.ffmpeg_failures.inc()
+            raise
+        metrics.ffmpeg_spawn.observe(time.perf_counter() - started)
+        return cls(source, data=data, volume=volume, start=start, filters=filters, gain=gain)
+
+class SavedRequester:
+    """Stands in for the member who queued a restored song when they are not in the member cache."""
+    __slots__ = ("id", "display_name")
+    def __init__(self, id: int, display_name: str):
+        self.id = id
+        self.display_name = display_name
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
 
 class Song:
-    def __init__(self, source: YTDLSource, requester: discord.Member):
-        self.source = source
+    """A queued track. Holds metadata only; the stream URL and FFmpeg source are resolved just before it plays."""
+    __slots__ = ("video_id", "_title", "_artist", "_duration", "webpage_url", "requester", "source",
+                 "queued_at", "requested_at", "resume_from")
+    def __init__(self, data: dict, requester: discord.Member):
+        self.video_id = data.get("id")
+        self._title = data.get("title")
+        self._artist = extract_artist(self._title, data.get("uploader"))
+        self._duration = data.get("duration")
+        self.webpage_url = data.get("webpage_url") or data.get("url")
         self.requester = requester
-    def title(self): return self.source.title
-    def artist(self): return self.source.artist
-    def duration(self): return self.source.duration
-    def url(self): return self.source.webpage_url
+        self.source: Optional[YTDLSource] = None  # set only while the song is playing
+        self.queued_at: Optional[float] = None  # perf_counter() when it last entered the queue
+        self.requested_at: Optional[float] = None  # set when requested on an idle player, for time-to-first-audio
+        self.resume_from = 0.0  # seconds to start at on the next play, set when restoring a saved session
+    def title(self): return self._title
+    def artist(self): return self._artist
+    def duration(self): return self._duration
+    def url(self): return self.webpage_url
+    async def resolve(self, *, volume: float, guild_id: Optional[int] = None,
+                      filters: FilterChain = NO_FILTERS) -> YTDLSource:
+        self.source = await YTDLSource.for_song(self, volume=volume, guild_id=guild_id, start=self.resume_from,
+                                                filters=filters)
+        self.resume_from = 0.0
+        return self.source
+    def to_dict(self) -> dict:
+        """Compact form for session persistence. Stream URLs expire, so only the page URL is kept."""
+        data = {"id": self.video_id, "title": self._title, "artist": self._artist, "duration": self._duration,
+                "url": self.webpage_url, "requester": [self.requester.id, self.requester.display_name]}
+        if self.resume_from:
+            data["start"] = self.resume_from
+        return data
+    @classmethod
+    def from_dict(cls, data: dict, guild: discord.Guild) -> "Song":
+        requester_id, name = data["requester"]
+        requester = guild.get_member(requester_id) or SavedRequester(requester_id, name)
+        song = cls({"id": data.get("id"), "title": data.get("title"), "duration": data.get("duration"),
+                    "webpage_url": data["url"]}, requester)
+        song._artist = data.get("artist")
+        song.resume_from = data.get("start", 0.0)
+        return song
+
+class SongQueue:
+    """Per-guild song queue with an awaitable get plus indexed removal, moves, shuffling and slicing in place."""
+    def __init__(self, history_size: int = 50):
+        self._items: deque[Song] = deque()
+        self._not_empty = asyncio.Event()
+        self.history: deque[Song] = deque(maxlen=history_size)  # songs handed to the player, oldest first
+        self.version = 0  # bumped on every mutation
+    def __len__(self):
+        return len(self._items)
+    def __iter__(self):
+        return iter(self._items)
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._items))
+            return list(itertools.islice(self._items, start, stop, step))
+        return self._items[index]
+    def empty(self) -> bool:
+        return not self._items
+    def peek(self) -> Optional[Song]:
+        return self._items[0] if self._items else None
+    def _changed(self):
+        self.version += 1
+        if self._items:
+            self._not_empty.set()
+    def put_nowait(self, song: Song):
+        song.queued_at = time.perf_counter()
+        self._items.append(song)
+        self._changed()
+    async def put(self, song: Song):
+        self.put_nowait(song)
+    def put_front(self, song: Song):
+        song.queued_at = time.perf_counter()
+        self._items.appendleft(song)
+        self._changed()
+    def extend(self, songs):
+        now = time.perf_counter()
+        for song in songs:
+            song.queued_at = now
+            self._items.append(song)
+        self._changed()
+    async def get(self) -> Song:
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        song = self._items.popleft()
+        self.history.append(song)
+        self._changed()
+        return song
+    def remove(self, index: int) -> Song:
+        song = self._items[index]
+        del self._items[index]
+        self._changed()
+        return song
+    def move(self, src: int, dst: int) -> Song:
+        song = self._items[src]
+        del self._items[src]
+        self._items.insert(dst, song)
+        self._changed()
+        return song
+    def shuffle(self):
+        # random.shuffle on a deque indexes from the ends, which is quadratic on long queues.
+        items = list(self._items)
+        random.shuffle(items)
+        self._items = deque(items)
+        self._changed()
+    def clear(self) -> int:
+        count = len(self._items)
+        self._items.clear()
+        self._changed()
+        return count
 
 class GuildMusicState:
     def __init__(self, bot, guild):
         self.bot = bot
         self.guild = guild
-        self.queue = asyncio.Queue()
+        self.queue = SongQueue()
         self.next = asyncio.Event()
         self.voice_client: Optional[discord.VoiceClient] = None
         self.current: Optional[Song] = None
         self.loop = "off"  # off/song/queue
         self.volume = 0.5
+        self.filters = NO_FILTERS
+        self._embeds: dict[str, tuple[tuple, discord.Embed]] = {}  # command -> (state key, last embed)
         self.playback_task: Optional[asyncio.Task] = None
+        self._background_tasks: set[asyncio.Task] = set()
+        self._prepared: Optional[tuple[Song, YTDLSource]] = None  # next song with its FFmpeg already running
+        self._prepare_task: Optional[asyncio.Task] = None
+        self._track_ended_at: Optional[float] = None
+        self._skipped = False  # the current song was skipped, so song loop must not replay it
+        self.transition_gaps: deque[float] = deque(maxlen=100)  # seconds of silence between queued tracks
+        self.importing = False  # a playlist is being enumerated into the queue
+        self.import_generation = 0  # bumped by stop() to abandon a running playlist import
+        self.last_active = time.monotonic()
+    def touch(self):
+        self.last_active = time.monotonic()
+    def idle_for(self, now: float) -> float:
+        if self.is_playing() or self.importing:
+            self.last_active = now
+        return now - self.last_active
+    def approx_size(self) -> int:
+        """Rough bytes held by this state, dominated by the queued songs."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__)
+        for song in itertools.chain(self.queue, self.queue.history):
+            size += sys.getsizeof(song) + sys.getsizeof(song._title or "") + sys.getsizeof(song.webpage_url or "")
+        return size
     async def audio_player_task(self):
         while True:
             self.next.clear()
+            self._skipped = False
             try:
                 song = await self.queue.get()
             except asyncio.CancelledError:
                 return
             self.current = song
-            source = song.source
-            source.volume = self.volume
-            def after_playing(error):
-                if error:
-                    print(f"[Error] Player error: {error}")
-                self.bot.loop.call_soon_threadsafe(self.next.set)
+            self.touch()
             if self.voice_client is None or not self.voice_client.is_connected():
                 self.current = None
                 return
+            try:
+                source = self._take_prepared(song) or await song.resolve(volume=self.volume, guild_id=self.guild.id,
+                                                                              filters=self.filters)
+            except asyncio.CancelledError:
+                self.current = None
+                return
+            except Exception as e:
+                log.error("Could not load %s in guild %s: %s", song.title(), self.guild.id, e)
+                metrics.load_failures.inc()
+                self.current = None
+                continue
+            def after_playing(error):
+                if error:
+                    log.error("Player error in guild %s: %s", self.guild.id, error)
+                    metrics.ffmpeg_failures.inc()
+                self._track_ended_at = time.perf_counter()
+                self.bot.loop.call_soon_threadsafe(self.next.set)
             self.voice_client.play(source, after=after_playing)
+            self._record_start(song, source)
+            self.prefetch()
+            self._schedule_prepare(song, offset=source.start)
             await self.next.wait()
-            if self.loop == "song" and self.current is not None:
-                await self.queue.put(self.current)
+            song.source = None
+            if self.loop == "song" and self.current is not None and not self._skipped:
+                self.queue.put_front(self.current)
             elif self.loop == "queue" and self.current is not None:
                 await self.queue.put(self.current)
+            if self.queue.empty():
+                self._track_ended_at = None  # waiting for a new request is not a transition gap
             self.current = None
+    def _record_start(self, song: Song, source: YTDLSource):
+        now = time.perf_counter()
+        gap = ttfa = None
+        if song.queued_at is not None:
+            metrics.queue_wait.observe(now - song.queued_at)
+        if self._track_ended_at is not None:
+            gap = now - self._track_ended_at
+            self.transition_gaps.append(gap)
+            metrics.transition_gap.observe(gap)
+            self._track_ended_at = None
+        if song.requested_at is not None:
+            ttfa = now - song.requested_at
+            metrics.time_to_first_audio.observe(ttfa)
+            song.requested_at = None
+        metrics.event("track_start", guild=self.guild.id, video_id=song.video_id, title=song.title(),
+                      passthrough=source.passthrough, queue_depth=len(self.queue), gap=gap, time_to_first_audio=ttfa)
+        if audio_cache is not None and (source.url or "").startswith(("http://", "https://")) \
+                and audio_cache.note_play(song.video_id, song.duration(), looping=self.loop != "off"):
+            self._spawn(audio_cache.fetch(song.video_id, source.data))
+    def prefetch(self):
+        """Warm the extraction cache for the next few queued songs so they start without waiting on yt_dlp."""
+        for song in self.queue[:PREFETCH_WINDOW]:
+            self._spawn(self._prefetch_one(song))
+    def _spawn(self, coro):
+        task = self.bot.loop.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    async def _prefetch_one(self, song: Song):
+        try:
+            await extraction_engine.extract(song.webpage_url, guild_id=self.guild.id)
+        except Exception:
+            pass  # retried when the song actually comes up
+    def _schedule_prepare(self, current: Song, offset: float = 0.0):
+        if self._prepare_task is not None and not self._prepare_task.done():
+            self._prepare_task.cancel()
+        if not current.duration():
+            return  # live stream: no known end to prepare for, and an early FFmpeg would idle all along
+        delay = max(0.0, (current.duration() - offset) / self.filters.rate - GAPLESS_LEAD)
+        self._prepare_task = self.bot.loop.create_task(self._prepare_next(delay))
+    async def _prepare_next(self, delay: float):
+        """Shortly before the current track ends, resolve the next one and start its FFmpeg pipe."""
+        await asyncio.sleep(delay)
+        song = self._upcoming()
+        if song is None or song.resume_from:
+            return
+        try:
+            source = await YTDLSource.for_song(song, volume=self.volume, guild_id=self.guild.id, filters=self.filters)
+        except Exception:
+            return
+        if self._upcoming() is not song:
+            source.cleanup()
+            return
+        self.discard_prepared()
+        self._prepared = (song, source)
+    def _upcoming(self) -> Optional[Song]:
+        """The song audio_player_task will play next, counting the current one coming back round on loop."""
+        if self.current is not None and ((self.loop == "song" and not self._skipped)
+                                         or (self.loop == "queue" and self.queue.empty())):
+            return self.current
+        return self.queue.peek()
+    def _take_prepared(self, song: Song) -> Optional[YTDLSource]:
+        if self._prepared is None or self._prepared[0] is not song:
+            self.discard_prepared()
+            return None
+        source = self._prepared[1]
+        self._prepared = None
+        if self._outdated(source):
+            source.cleanup()  # volume or filters changed since it was prepared
+            return None
+        source.volume = self.volume
+        song.source = source
+        return source
+    def _outdated(self, source: YTDLSource) -> bool:
+        """Whether `source` cannot play at the current settings by adjusting its volume. Python only scales
+        frames down, so a PCM source cannot get louder than the gain its FFmpeg was started with."""
+        return source.filters != self.filters \
+            or source.passthrough != wants_passthrough(source.data, self.volume, self.filters) \
+            or (not source.passthrough and self.volume > source.gain)
+    def discard_prepared(self):
+        if self._prepared is not None:
+            self._prepared[1].cleanup()
+            self._prepared = None
+    def cached_embed(self, name: str, key: tuple, build: Callable[[], discord.Embed]) -> discord.Embed:
+        """The embed last rendered for `name` while `key` (the state it shows) is unchanged, else a new one."""
+        cached = self._embeds.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        embed = build()
+        self._embeds[name] = (key, embed)
+        return embed
+    def session_signature(self) -> tuple:
+        """Changes whenever the saved session would: queue edits, settings, track changes, voice moves,
+        and every SESSION_POSITION_STEP seconds of playback."""
+        voice = self.voice_client
+        channel = voice.channel.id if voice is not None and voice.is_connected() else None
+        step = int(self.position() // SESSION_POSITION_STEP) if self.current is not None else None
+        return (self.queue.version, self.loop, self.volume, self.filters, self.current, channel, step, self.is_paused())
+    def to_session(self) -> Optional[dict]:
+        """Queue and player settings as a JSON-able dict, or None when there is nothing worth restoring."""
+        if self.current is None and self.queue.empty() and self.volume == 0.5 and self.loop == "off" and not self.filters:
+            return None
+        voice = self.voice_client
+        connected = voice is not None and voice.is_connected()
+        return {
+            "loop": self.loop,
+            "volume": self.volume,
+            "effects": list(self.filters.effects),
+            "speed": self.filters.speed,
+            "channel": voice.channel.id if connected else None,
+            "playing": connected and self.current is not None and not self.is_paused(),
+            "position": round(self.position(), 1),
+            "current": self.current.to_dict() if self.current is not None else None,
+            "queue": [song.to_dict() for song in self.queue],
+        }
+    def restore_session(self, session: dict):
+        """Rebuild settings and queue from to_session() output; the interrupted song goes first, at its position."""
+        self.loop = session.get("loop", "off")
+        self.volume = session.get("volume", 0.5)
+        self.filters = FilterChain(session.get("effects", ()), session.get("speed", 1.0))
+        songs = [Song.from_dict(item, self.guild) for item in session.get("queue", ())]
+        if session.get("current"):
+            current = Song.from_dict(session["current"], self.guild)
+            current.resume_from = session.get("position", 0.0)
+            songs.insert(0, current)
+        if songs:
+            self.queue.extend(songs)
+    def position(self) -> float:
+        if self.current is None or self.current.source is None:
+            return 0.0
+        return self.current.source.position
+    async def seek(self, seconds: float) -> bool:
+        """Restart the current song at `seconds`, swapping the source under the running player so the
+        after-callback (and with it loop and skip handling) is untouched. The cached stream URL is reused
+        unless it has expired; tracks in the audio cache seek within the local file."""
+        song = self.current
+        if song is None or song.source is None or self.voice_client is None:
+            return False
+        old = song.source
+        source = await YTDLSource.for_song(song, volume=self.volume, guild_id=self.guild.id, start=seconds,
+                                           filters=self.filters)
+        if self.current is not song or song.source is not old or not (self.is_playing() or self.is_paused()):
+            source.cleanup()
+            return False
+        paused = self.is_paused()
+        source.volume = self.volume  # /volume may have run while FFmpeg was starting
+        song.source = source
+        self.voice_client.source = source
+        if paused:
+            self.voice_client.pause()
+        self._schedule_prepare(song, offset=seconds)
+        if self._outdated(source):
+            self._spawn(self._restart_current())  # settings moved past what this source can follow
+        # The player thread may still be inside old.read(); let it finish before killing FFmpeg.
+        self.bot.loop.call_later(1, old.cleanup)
+        return True
+    def set_volume(self, volume: float):
+        self.volume = volume
+        source = self.current.source if self.current else None
+        if source is None:
+            return
+        if self._outdated(source):
+            # Switching between Opus passthrough and PCM scaling needs a new FFmpeg at the same position,
+            # as does going louder than the volume FFmpeg was started with.
+            self._spawn(self._restart_current())
+        else:
+            source.volume = volume
+    def set_filters(self, filters: FilterChain):
+        """Switch filters. A playing song restarts at its current position from the cached extraction;
+        the old FFmpeg keeps playing until the new one is ready."""
+        self.filters = filters
+        self.discard_prepared()
+        if self.current is not None and self.current.source is not None:
+            self._spawn(self._restart_current())
+    async def _restart_current(self):
+        try:
+            await self.seek(self.position())
+        except Exception as e:
+            log.error("Could not restart playback in guild %s: %s", self.guild.id, e)
     def skip(self):
         if self.voice_client and self.voice_client.is_playing():
+            self._skipped = True
             self.voice_client.stop()
             return True
         return False
@@ -128,13 +1460,12 @@ class GuildMusicState:
             self.voice_client.stop()
         self.clear_queue()
         self.current = None
+        self.import_generation += 1
+        if self._prepare_task is not None and not self._prepare_task.done():
+            self._prepare_task.cancel()
+        self.discard_prepared()
     def clear_queue(self):
-        while not self.queue.empty():
-            try:
-                self.queue.get_nowait()
-                self.queue.task_done()
-            except asyncio.QueueEmpty:
-                break
+        self.queue.clear()
     def is_playing(self):
         if self.voice_client is None:
             return False
@@ -144,16 +1475,274 @@ class GuildMusicState:
             return False
         return self.voice_client.is_paused()
 
+class RateLimiter:
+    """Token buckets keyed by user or guild id. A bucket is forgotten once it would be full again, so only
+    recently active ids take memory."""
+    def __init__(self, burst: int, per_second: float, maxsize: int = 100000):
+        self.burst = burst
+        self.per_second = per_second
+        self._buckets = TTLCache(maxsize)  # key -> (tokens, monotonic time of last update)
+    def _tokens(self, key, now: float) -> float:
+        tokens, updated = self._buckets.get(key, now) or (self.burst, now)
+        return min(self.burst, tokens + (now - updated) * self.per_second)
+    def retry_after(self, key, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available; 0 when they are now."""
+        cost = min(cost, self.burst)
+        return max(0.0, (cost - self._tokens(key, now)) / self.per_second)
+    def take(self, key, cost: float, now: float):
+        tokens = self._tokens(key, now) - min(cost, self.burst)
+        self._buckets.set(key, (tokens, now), now + (self.burst - tokens) / self.per_second)
+
+class LoopLagMonitor:
+    """Measures event loop lag as how late a short sleep wakes up. Rises at once and decays slowly, so
+    shedding starts on the first slow sample and does not flap."""
+    def __init__(self, threshold: float, interval: float = LOOP_LAG_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+    @property
+    def overloaded(self) -> bool:
+        return self.lag > self.threshold
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            sample = max(0.0, loop.time() - started - self.interval)
+            self.lag = sample if sample > self.lag else self.lag * 0.8 + sample * 0.2
+
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.music_states: dict[int, GuildMusicState] = {}
+        self.snapshots = TTLCache(SNAPSHOT_LIMIT)  # guild id -> (volume, loop) kept after eviction
+        self.evictions = 0
+        self.sessions = SqliteStore(SESSION_STORE_PATH, "sessions") if SESSION_STORE_PATH else None
+        self.saved_sessions: dict[int, dict] = {}  # loaded at startup, turned into guild state on first use
+        self.persisted: dict[int, tuple] = {}  # guild id -> session_signature() last written
+        self.stored_sessions: set[int] = set()  # evicted guilds whose session was written and dropped from memory
+        self._session_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions")
+        self._sessions_resumed = False
+        self._autocomplete_latest: dict[int, object] = {}  # user id -> token of their newest keystroke
+        self.user_limits = RateLimiter(RATE_USER_BURST, RATE_USER_PER_SECOND)
+        self.guild_limits = RateLimiter(RATE_GUILD_BURST, RATE_GUILD_PER_SECOND)
+        self.lag_monitor = LoopLagMonitor(LOOP_LAG_THRESHOLD)
+    async def cog_load(self):
+        self.reap_idle.start()
+        self.lag_monitor.start()
+        metrics.add_collector(self.collect_metrics)
+        if self.sessions is not None:
+            loop = asyncio.get_running_loop()
+            rows = await loop.run_in_executor(self._session_writer, self.sessions.items)
+            self.saved_sessions = {int(key): session for key, session in rows}
+            self.persist_sessions.start()
+    async def cog_unload(self):
+        self.reap_idle.cancel()
+        self.lag_monitor.stop()
+        metrics.remove_collector(self.collect_metrics)
+        if self.sessions is not None:
+            self.persist_sessions.cancel()
+            await self.flush_sessions(force=True)  # capture current positions before voice disconnects
+        self._session_writer.shutdown(wait=True)
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        """Admission control for every command: heavy commands are shed while the event loop lags, and each
+        command spends tokens from its user's and its guild's buckets."""
+        interaction.extras["started"] = time.perf_counter()
+        name = interaction.command.name if interaction.command is not None else ""
+        cost = COMMAND_COSTS.get(name, 1)
+        if cost > 1 and self.lag_monitor.overloaded:
+            metrics.rejected.inc(reason="overload")
+            await interaction.response.send_message("⏳ I'm under heavy load right now, try again in a few seconds.",
+                                                    ephemeral=True)
+            return False
+        now = time.monotonic()
+        wait = max(self.user_limits.retry_after(interaction.user.id, cost, now),
+                   self.guild_limits.retry_after(interaction.guild_id, cost, now))
+        if wait > 0:
+            metrics.rejected.inc(reason="rate_limit")
+            await interaction.response.send_message(f"Slow down! Try again in {math.ceil(wait)}s.", ephemeral=True)
+            return False
+        self.user_limits.take(interaction.user.id, cost, now)
+        self.guild_limits.take(interaction.guild_id, cost, now)
+        if interaction.guild_id in self.stored_sessions and interaction.guild_id not in self.music_states:
+            await self._load_stored_session(interaction.guild_id)
+        return True
+    async def _load_stored_session(self, guild_id: int):
+        """Read back the session an eviction wrote, so get_guild_state() restores it without touching disk."""
+        try:
+            row = await self.sessions.aget(str(guild_id))
+        except sqlite3.Error as e:
+            log.warning("Could not load the saved session of guild %s: %s", guild_id, e)
+            return
+        self.stored_sessions.discard(guild_id)
+        if row is not None and guild_id not in self.music_states:
+            self.saved_sessions.setdefault(guild_id, row[0])
+    async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if isinstance(error, app_commands.CheckFailure):
+            return  # interaction_check already told the user
+        name = interaction.command.name if interaction.command is not None else "?"
+        log.error("Error in /%s", name, exc_info=error)
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        started = interaction.extras.get("started")
+        if started is not None:
+            metrics.command.observe(time.perf_counter() - started, command=command.name)
     def get_guild_state(self, guild: discord.Guild) -> GuildMusicState:
         state = self.music_states.get(guild.id)
         if state is None:
             state = GuildMusicState(self.bot, guild)
+            session = self.saved_sessions.pop(guild.id, None)
+            snapshot = self.snapshots.pop(guild.id)
+            if session is not None:
+                state.restore_session(session)
+                self.persisted[guild.id] = ()  # the saved row exists; rewrite or delete it at the next flush
+            elif snapshot is not None:
+                state.volume, state.loop = snapshot
             self.music_states[guild.id] = state
+        state.touch()
         return state
+    async def evict(self, state: GuildMusicState):
+        """Leave voice, stop the player task and drop the guild's state. A paused queue is kept as a saved
+        session, restored when the guild next uses a command."""
+        guild_id = state.guild.id
+        if self.music_states.get(guild_id) is state:
+            del self.music_states[guild_id]
+        session = state.to_session() if self.sessions is not None else None
+        if session is not None:
+            session["playing"] = False  # voice is left below, so don't rejoin it at startup
+            self.saved_sessions[guild_id] = session  # until the next flush has written it
+            self.persisted[guild_id] = ()
+        if state.volume != 0.5 or state.loop != "off":
+            self.snapshots.set(guild_id, (state.volume, state.loop), math.inf)
+        state.stop()
+        if state.playback_task and not state.playback_task.done():
+            state.playback_task.cancel()
+        voice_client = state.guild.voice_client or state.voice_client
+        state.voice_client = None
+        if voice_client is not None:
+            try:
+                await voice_client.disconnect()
+            except Exception as e:
+                log.warning("Failed to disconnect idle voice client in guild %s: %s", guild_id, e)
+        self.evictions += 1
+    @tasks.loop(seconds=REAPER_INTERVAL)
+    async def reap_idle(self):
+        now = time.monotonic()
+        for state in list(self.music_states.values()):
+            if state.idle_for(now) >= IDLE_TIMEOUT:
+                await self.evict(state)
+    @reap_idle.before_loop
+    async def before_reap_idle(self):
+        await self.bot.wait_until_ready()
+    @tasks.loop(seconds=SESSION_FLUSH_INTERVAL)
+    async def persist_sessions(self):
+        await self.flush_sessions()
+    async def flush_sessions(self, *, force: bool = False):
+        """Write behind: sessions that changed since the last flush are serialized here and written in one
+        transaction on the session thread, so command handlers never wait on disk."""
+        changed, gone, evicted = [], [], []
+        for guild_id, state in self.music_states.items():
+            signature = state.session_signature()
+            if not force and self.persisted.get(guild_id) == signature:
+                continue
+            session = state.to_session()
+            if session is None:
+                if self.persisted.pop(guild_id, None) is not None:
+                    gone.append(guild_id)
+                continue
+            changed.append((str(guild_id), session))
+            self.persisted[guild_id] = signature
+        for guild_id in [gid for gid in self.persisted if gid not in self.music_states]:
+            del self.persisted[guild_id]
+            if guild_id in self.saved_sessions:
+                session = self.saved_sessions[guild_id]  # evicted with a queue left
+                changed.append((str(guild_id), session))
+                evicted.append((guild_id, session))
+            else:
+                gone.append(guild_id)
+        if not changed and not gone:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._session_writer, self._write_sessions, changed, [str(g) for g in gone])
+        except Exception as e:
+            log.error("Could not save %d sessions: %s", len(changed) + len(gone), e)
+            for key, _ in changed:
+                self.persisted[int(key)] = ()  # retried at the next flush, evicted guilds included
+            return
+        for guild_id, session in evicted:
+            if self.saved_sessions.get(guild_id) is session:
+                del self.saved_sessions[guild_id]  # on disk now; _load_stored_session() reads it back
+                self.stored_sessions.add(guild_id)
+    def _write_sessions(self, changed: list[tuple[str, dict]], gone: list[str]):
+        self.sessions.set_many(changed, time.time() + SESSION_MAX_AGE)
+        self.sessions.delete_many(gone)
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Reconnect voice for guilds that were playing when the bot went down. Everything else stays saved
+        until the guild next uses a command."""
+        if self._sessions_resumed:
+            return
+        self._sessions_resumed = True
+        slots = asyncio.Semaphore(SESSION_RESUME_CONCURRENCY)
+        playing = [guild_id for guild_id, session in self.saved_sessions.items() if session.get("playing")]
+        results = await asyncio.gather(*(self._resume_session(guild_id, slots) for guild_id in playing))
+        if playing:
+            log.info("Resumed playback in %d of %d guilds", sum(results), len(playing))
+    async def _resume_session(self, guild_id: int, slots: asyncio.Semaphore) -> bool:
+        guild = self.bot.get_guild(guild_id)
+        session = self.saved_sessions.get(guild_id)
+        if guild is None or session is None or guild.voice_client is not None:
+            return False  # another shard's guild, the bot was removed, or it was already restored
+        channel = guild.get_channel(session.get("channel") or 0)
+        if channel is None:
+            return False
+        state = self.get_guild_state(guild)
+        async with slots:
+            try:
+                state.voice_client = await channel.connect()
+            except Exception as e:
+                log.warning("Could not rejoin voice in guild %s: %s", guild_id, e)
+                return False
+        if state.playback_task is None or state.playback_task.done():
+            state.playback_task = self.bot.loop.create_task(state.audio_player_task())
+        return True
+    def stats(self) -> dict:
+        states = list(self.music_states.values())
+        return {
+            "active_guilds": len(states),
+            "voice_connections": sum(1 for st in states if st.voice_client is not None and st.voice_client.is_connected()),
+            "player_tasks": sum(1 for st in states if st.playback_task is not None and not st.playback_task.done()),
+            "state_bytes": sum(st.approx_size() for st in states),
+            "snapshots": len(self.snapshots),
+            "saved_sessions": len(self.saved_sessions),
+            "evictions": self.evictions,
+        }
+    def collect_metrics(self):
+        stats = self.stats()
+        yield "musicbot_active_guilds", "Guilds with music state in memory", [({}, stats["active_guilds"])]
+        yield "musicbot_voice_connections", "Connected voice clients", [({}, stats["voice_connections"])]
+        yield "musicbot_active_players", "Guilds currently playing audio", \
+            [({}, sum(1 for st in self.music_states.values() if st.is_playing()))]
+        yield "musicbot_player_tasks", "Running audio player tasks", [({}, stats["player_tasks"])]
+        yield "musicbot_guild_state_bytes", "Approximate memory held by guild music state", [({}, stats["state_bytes"])]
+        yield "musicbot_queue_depth", "Songs waiting in each guild's queue", \
+            [({"guild": guild_id}, len(st.queue)) for guild_id, st in self.music_states.items() if len(st.queue)]
+        samples = []
+        for guild_id, st in self.music_states.items():
+            source = st.current.source if st.current is not None else None
+            cpu = source.ffmpeg_cpu_percent() if source is not None else None
+            if cpu is not None:
+                samples.append(({"guild": guild_id, "filters": source.filters.describe()}, cpu))
+        yield "musicbot_event_loop_lag_seconds", "Smoothed event loop lag", [({}, self.lag_monitor.lag)]
+        yield "musicbot_ffmpeg_cpu_percent", "CPU of each guild's FFmpeg process since it started, percent of one core", \
+            samples
     async def ensure_voice(self, interaction: discord.Interaction) -> Optional[discord.VoiceChannel]:
         if interaction.user.voice and interaction.user.voice.channel:
             return interaction.user.voice.channel
@@ -223,19 +1812,100 @@ class Music(commands.Cog):
                 await interaction.guild.voice_client.move_to(voice_channel)
         # Defer for long operation
         await interaction.response.defer()
+        if is_playlist_url(query):
+            await self.enqueue_playlist(interaction, guild_state, query)
+            return
         try:
-            source = await YTDLSource.from_url(query, loop=self.bot.loop, stream=True, volume=guild_state.volume)
-            song = Song(source, requester=interaction.user)
+            data = await extraction_engine.extract(query, guild_id=interaction.guild.id)
+            song = Song(data, requester=interaction.user)
+        except ExtractionBusy as e:
+            await interaction.followup.send(f"⏳ {e}", ephemeral=True)
+            return
         except Exception as e:
             await interaction.followup.send(f"❌ Error: {str(e)}")
             return
         if not guild_state.is_playing() and guild_state.queue.empty() and guild_state.current is None:
+            song.requested_at = interaction.extras.get("started")
             await guild_state.queue.put(song)
             await interaction.followup.send(f"▶️ Now playing: **{song.title()}** (*requested by {song.requester.display_name}*)")
         else:
             await guild_state.queue.put(song)
             await interaction.followup.send(f"➕ Added to queue: **{song.title()}** (*requested by {song.requester.display_name}*)")
 
+    @play.autocomplete("query")
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        """Suggest recently seen tracks, topped up by a debounced YouTube search. Each choice's value is the
+        watch URL, so picking one skips the search that free text would need."""
+        if current.strip().startswith(("http://", "https://")):
+            return []
+        suggestions = title_index.search(current)
+        results = extraction_engine.cached_search(current)
+        if results is None and len(suggestions) < SEARCH_RESULTS and len(current.strip()) >= AUTOCOMPLETE_MIN_SEARCH \
+                and not self.lag_monitor.overloaded:
+            user_id = interaction.user.id
+            token = self._autocomplete_latest[user_id] = object()
+            await asyncio.sleep(AUTOCOMPLETE_DEBOUNCE)
+            if self._autocomplete_latest.get(user_id) is token:  # otherwise a newer keystroke replaced this one
+                search = asyncio.ensure_future(extraction_engine.search(current, guild_id=interaction.guild_id))
+                search.add_done_callback(lambda f: f.cancelled() or f.exception())
+                try:
+                    # Shielded so a slow search still lands in the cache for the next keystroke.
+                    results = await asyncio.wait_for(asyncio.shield(search), AUTOCOMPLETE_TIMEOUT)
+                except Exception:
+                    results = None
+                finally:
+                    if self._autocomplete_latest.get(user_id) is token:
+                        del self._autocomplete_latest[user_id]
+        seen = {url for _, url in suggestions}
+        for entry in results or ():
+            url = entry.get("webpage_url") or entry.get("url")
+            if entry.get("title") and url and url not in seen:
+                suggestions.append((entry["title"], url))
+                seen.add(url)
+        return [app_commands.Choice(name=title[:100], value=url) for title, url in suggestions[:25] if len(url) <= 100]
+
+    async def enqueue_playlist(self, interaction: discord.Interaction, guild_state: GuildMusicState, url: str):
+        if guild_state.importing:
+            await interaction.followup.send("A playlist is already loading for this server.", ephemeral=True)
+            return
+        guild_state.importing = True
+        generation = guild_state.import_generation
+        added = 0
+        message = None
+        failed = False
+        try:
+            # Closed on break too, so the generator gives back its playlist slot right away.
+            async with contextlib.aclosing(extraction_engine.iter_playlist(url, guild_id=interaction.guild.id)) as entries:
+                async for entry in entries:
+                    if guild_state.import_generation != generation:
+                        break
+                    song = Song(entry, requester=interaction.user)
+                    if added == 0 and not guild_state.is_playing() and guild_state.queue.empty() and guild_state.current is None:
+                        song.requested_at = interaction.extras.get("started")
+                    await guild_state.queue.put(song)
+                    added += 1
+                    if added == PLAYLIST_FIRST_PAGE:
+                        message = await interaction.followup.send(f"📜 Queued {added} songs, loading the rest of the playlist...")
+        except ExtractionBusy as e:
+            failed = True
+            await interaction.followup.send(f"⏳ {e}", ephemeral=True)
+        except Exception as e:
+            failed = True
+            await interaction.followup.send(f"❌ Error: {str(e)}")
+        finally:
+            guild_state.importing = False
+        if added == 0:
+            if not failed:
+                await interaction.followup.send("No playable songs found in that playlist.")
+            return
+        text = f"📜 Added **{added}** songs from the playlist (*requested by {interaction.user.display_name}*)"
+        if added >= PLAYLIST_MAX_TRACKS:
+            text += f" — stopped at the {PLAYLIST_MAX_TRACKS} song limit"
+        if message is not None:
+            await message.edit(content=text)
+        else:
+            await interaction.followup.send(text)
+
     # /pause
     @app_commands.command(name="pause", description="Pause playback")
     async def pause(self, interaction: discord.Interaction):
@@ -296,11 +1966,17 @@ class Music(commands.Cog):
 
     # /queue
     @app_commands.command(name="queue", description="Show song queue")
-    async def queue(self, interaction: discord.Interaction):
+    @app_commands.describe(page="Page of the queue to show (10 songs per page)")
+    async def queue(self, interaction: discord.Interaction, page: int = 1):
         guild_state = self.get_guild_state(interaction.guild)
         if guild_state.current is None and guild_state.queue.empty():
             await interaction.response.send_message("Queue is empty.", ephemeral=True)
             return
+        page = min(max(page, 1), max(1, (len(guild_state.queue) + 9) // 10))
+        embed = guild_state.cached_embed("queue", (guild_state.queue.version, guild_state.current, page),
+                                         lambda: self.build_queue_embed(guild_state, page))
+        await interaction.response.send_message(embed=embed)
+    def build_queue_embed(self, guild_state: GuildMusicState, page: int) -> discord.Embed:
         embed = discord.Embed(title="🎶 Queue", color=discord.Color.blurple())
         if guild_state.current:
             embed.add_field(name="Now Playing", value=f"**{guild_state.current.title()}**", inline=False)
@@ -309,14 +1985,18 @@ class Music(commands.Cog):
         if guild_state.queue.empty():
             embed.add_field(name="Up Next", value="Queue is empty.", inline=False)
         else:
-            queue_items = list(guild_state.queue._queue)
+            total = len(guild_state.queue)
+            pages = (total + 9) // 10
+            start = (page - 1) * 10
             desc = ""
-            for i, song in enumerate(queue_items[:10], start=1):
+            for i, song in enumerate(guild_state.queue[start:start + 10], start=start + 1):
                 desc += f"**{i}.** {song.title()} (*{song.requester.display_name}*)\n"
-            if len(queue_items) > 10:
-                desc += f"... and {len(queue_items)-10} more"
+            if total > start + 10:
+                desc += f"... and {total - start - 10} more"
             embed.add_field(name="Up Next", value=desc, inline=False)
-        await interaction.response.send_message(embed=embed)
+            if pages > 1:
+                embed.set_footer(text=f"Page {page}/{pages}")
+        return embed
 
     # /remove
     @app_commands.command(name="remove", description="Remove from queue (by position)")
@@ -329,16 +2009,27 @@ class Music(commands.Cog):
         if guild_state.queue.empty():
             await interaction.response.send_message("Queue is empty.", ephemeral=True)
             return
-        queue_items = list(guild_state.queue._queue)
-        if pos > len(queue_items):
+        if pos > len(guild_state.queue):
             await interaction.response.send_message("No song at that queue position.", ephemeral=True)
             return
-        removed_song = queue_items.pop(pos - 1)
-        guild_state.clear_queue()
-        for s in queue_items:
-            await guild_state.queue.put(s)
+        removed_song = guild_state.queue.remove(pos - 1)
         await interaction.response.send_message(f"🗑️ Removed **{removed_song.title()}**.")
 
+    # /move
+    @app_commands.command(name="move", description="Move a song to another queue position")
+    @app_commands.describe(src="Current position in the queue", dst="New position in the queue")
+    async def move(self, interaction: discord.Interaction, src: int, dst: int):
+        guild_state = self.get_guild_state(interaction.guild)
+        size = len(guild_state.queue)
+        if size == 0:
+            await interaction.response.send_message("Queue is empty.", ephemeral=True)
+            return
+        if not (1 <= src <= size and 1 <= dst <= size):
+            await interaction.response.send_message(f"Positions must be between 1 and {size}.", ephemeral=True)
+            return
+        moved_song = guild_state.queue.move(src - 1, dst - 1)
+        await interaction.response.send_message(f"↕️ Moved **{moved_song.title()}** to position {dst}.")
+
     # /clearqueue
     @app_commands.command(name="clearqueue", description="Clear the song queue")
     async def clearqueue(self, interaction: discord.Interaction):
@@ -357,18 +2048,24 @@ class Music(commands.Cog):
         if current is None:
             await interaction.response.send_message("Nothing is currently playing.", ephemeral=True)
             return
+        duration_s = current.duration() or 0
+        elapsed_s = min(guild_state.position(), duration_s) if duration_s else guild_state.position()
+        # The embed shows whole seconds, so it is rebuilt at most once a second while playing.
+        embed = guild_state.cached_embed("nowplaying", (current, int(elapsed_s), guild_state.filters),
+                                         lambda: self.build_nowplaying_embed(guild_state, current, elapsed_s))
+        await interaction.response.send_message(embed=embed)
+    def build_nowplaying_embed(self, guild_state: GuildMusicState, current: Song, elapsed_s: float) -> discord.Embed:
         title = current.title() or "Unknown Title"
         artist = current.artist() or "Unknown Artist"
         duration_s = current.duration() or 0
         url = current.url() or ""
-        def format_duration(duration: int):
-            hours, remainder = divmod(duration, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            return f"{hours}:{minutes:02}:{seconds:02}" if hours else f"{minutes}:{seconds:02}"
-        embed = discord.Embed(title="🎵 Now Playing",
-                description=f"**{title}**\nArtist: {artist}\nDuration: {format_duration(duration_s)}\n[Source Link]({url})",
+        description = f"**{title}**\nArtist: {artist}\nPosition: {format_duration(elapsed_s)} / {format_duration(duration_s)}"
+        if guild_state.filters:
+            cpu = current.source.ffmpeg_cpu_percent() if current.source is not None else None
+            description += f"\nFilters: {guild_state.filters.describe()}" + (f" (FFmpeg CPU {cpu:.1f}%)" if cpu is not None else "")
+        return discord.Embed(title="🎵 Now Playing",
+                description=f"{description}\n[Source Link]({url})",
                 color=discord.Color.green())
-        await interaction.response.send_message(embed=embed)
 
     # /volume
     @app_commands.command(name="volume", description="Set playback volume (1-100%)")
@@ -381,9 +2078,7 @@ class Music(commands.Cog):
         if not 0 < vol <= 100:
             await interaction.response.send_message("Volume must be 1-100.", ephemeral=True)
             return
-        guild_state.volume = vol / 100
-        if guild_state.current and guild_state.current.source:
-            guild_state.current.source.volume = guild_state.volume
+        guild_state.set_volume(vol / 100)
         await interaction.response.send_message(f"🔊 Volume set to {vol}%.")
 
     # /loop
@@ -410,19 +2105,36 @@ class Music(commands.Cog):
         if guild_state.queue.empty():
             await interaction.response.send_message("Queue is empty.", ephemeral=True)
             return
-        queue_items = list(guild_state.queue._queue)
-        random.shuffle(queue_items)
-        guild_state.clear_queue()
-        for s in queue_items:
-            await guild_state.queue.put(s)
+        guild_state.queue.shuffle()
         await interaction.response.send_message("🔀 Shuffled the queue.")
 
+    # /filter
+    @app_commands.command(name="filter", description="Toggle an audio effect")
+    @app_commands.describe(effect="Effect to switch on or off, or 'off' to clear all effects and speed")
+    @app_commands.choices(effect=[app_commands.Choice(name=name, value=name) for name in (*AUDIO_EFFECTS, "off")])
+    async def filter(self, interaction: discord.Interaction, effect: str):
+        guild_state = self.get_guild_state(interaction.guild)
+        filters = NO_FILTERS if effect == "off" else guild_state.filters.toggle(effect)
+        guild_state.set_filters(filters)
+        await interaction.response.send_message(f"🎛️ Filters: {filters.describe()}.")
+
+    # /speed
+    @app_commands.command(name="speed", description="Change playback speed without changing pitch")
+    @app_commands.describe(rate="Speed multiplier (0.5-2.0)")
+    async def speed(self, interaction: discord.Interaction, rate: float):
+        guild_state = self.get_guild_state(interaction.guild)
+        if not 0.5 <= rate <= 2.0:
+            await interaction.response.send_message("Speed must be between 0.5 and 2.0.", ephemeral=True)
+            return
+        guild_state.set_filters(guild_state.filters.with_speed(round(rate, 2)))
+        await interaction.response.send_message(f"⏩ Speed set to {round(rate, 2):g}x.")
+
     # /seek
     @app_commands.command(name="seek", description="Seek to specific time in song")
     @app_commands.describe(time="Time (mm:ss, hh:mm:ss, or seconds)")
     async def seek(self, interaction: discord.Interaction, time: str):
         guild_state = self.get_guild_state(interaction.guild)
-        if guild_state.current is None or guild_state.voice_client is None:
+        if guild_state.current is None or guild_state.current.source is None or guild_state.voice_client is None:
             await interaction.response.send_message("Nothing is currently playing.", ephemeral=True)
             return
         try:
@@ -430,26 +2142,23 @@ class Music(commands.Cog):
         except Exception:
             await interaction.response.send_message("Invalid time format. Use 'mm:ss', 'hh:mm:ss', or seconds.", ephemeral=True)
             return
-        if seconds < 0 or (guild_state.current.duration and seconds > guild_state.current.duration):
+        duration = guild_state.current.duration()
+        if seconds < 0 or (duration and seconds > duration):
             await interaction.response.send_message("Seek out of range.", ephemeral=True)
             return
-        guild_state.voice_client.stop()
+        await interaction.response.defer()
         try:
-            ffmpeg_options_seek = {"options": f"-vn -ss {seconds}"}
-            source_url = guild_state.current.source.data.get("url")
-            if not source_url:
-                await interaction.response.send_message("Cannot seek this source.", ephemeral=True)
-                return
-            audio_source = discord.FFmpegPCMAudio(source_url, **ffmpeg_options_seek)
-            volume_source = discord.PCMVolumeTransformer(audio_source, volume=guild_state.volume)
-            def after_playing(error):
-                if error:
-                    print(f"[Error] Seek error: {error}")
-                self.bot.loop.call_soon_threadsafe(guild_state.next.set)
-            guild_state.voice_client.play(volume_source, after=after_playing)
-            await interaction.response.send_message(f"⏩ Seeked to {time}.")
+            seeked = await guild_state.seek(seconds)
+        except ExtractionBusy as e:
+            await interaction.followup.send(f"⏳ {e}", ephemeral=True)
+            return
         except Exception as e:
-            await interaction.response.send_message(f"Failed to seek: `{str(e)}`", ephemeral=True)
+            await interaction.followup.send(f"Failed to seek: `{str(e)}`", ephemeral=True)
+            return
+        if not seeked:
+            await interaction.followup.send("Nothing is currently playing.", ephemeral=True)
+            return
+        await interaction.followup.send(f"⏩ Seeked to {format_duration(seconds)}.")
 
     # /lyrics
     @app_commands.command(name="lyrics", description="Fetch lyrics for current (or specified) song")
@@ -467,57 +2176,151 @@ class Music(commands.Cog):
             parts = query.split("-", 1)
             artist, title = parts[0].strip(), parts[1].strip()
         await interaction.response.defer()
-        async with aiohttp.ClientSession() as session:
-            try:
-                url = f"https://api.lyrics.ovh/v1/{artist}/{title}"
-                async with session.get(url) as resp:
-                    if resp.status != 200:
-                        await interaction.followup.send(f"Couldn't find lyrics for `{query}`.")
-                        return
-                    data = await resp.json()
-                    lyrics = data.get("lyrics")
-                    if not lyrics or lyrics.strip() == "":
-                        await interaction.followup.send(f"No lyrics found for `{query}`.")
-                        return
-                    max_len = 2048
-                    if len(lyrics) > max_len:
-                        lyrics = lyrics[:max_len-3] + "..."
-                    embed = discord.Embed(title=f"Lyrics: {query}", description=lyrics, color=discord.Color.purple())
-                    await interaction.followup.send(embed=embed)
-            except Exception as e:
-                await interaction.followup.send(f"Error fetching lyrics: `{str(e)}`")
+        try:
+            lyrics = await self.bot.lyrics.get(self.bot.http_session, artist, title)
+        except Exception as e:
+            await interaction.followup.send(f"Error fetching lyrics: `{str(e)}`")
+            return
+        if not lyrics:
+            await interaction.followup.send(f"No lyrics found for `{query}`.")
+            return
+        max_len = 2048
+        if len(lyrics) > max_len:
+            lyrics = lyrics[:max_len-3] + "..."
+        embed = discord.Embed(title=f"Lyrics: {query}", description=lyrics, color=discord.Color.purple())
+        await interaction.followup.send(embed=embed)
 
 # Bot Setup
 
-class MusicBot(commands.Bot):
-    def __init__(self):
-        super().__init__(command_prefix="/", intents=intents)
-        self.tree.add_command(Music(self).join)
-        self.tree.add_command(Music(self).leave)
-        self.tree.add_command(Music(self).play)
-        self.tree.add_command(Music(self).pause)
-        self.tree.add_command(Music(self).resume)
-        self.tree.add_command(Music(self).stop)
-        self.tree.add_command(Music(self).skip)
-        self.tree.add_command(Music(self).queue)
-        self.tree.add_command(Music(self).remove)
-        self.tree.add_command(Music(self).clearqueue)
-        self.tree.add_command(Music(self).nowplaying)
-        self.tree.add_command(Music(self).volume)
-        self.tree.add_command(Music(self).loop)
-        self.tree.add_command(Music(self).shuffle)
-        self.tree.add_command(Music(self).seek)
-        self.tree.add_command(Music(self).lyrics)
+class StartupTimeline:
+    """Milestones since process start, logged once the bot is ready."""
+    def __init__(self, origin: float):
+        self.origin = origin
+        self.marks: list[tuple[str, float]] = []
+    def mark(self, name: str):
+        self.marks.append((name, time.perf_counter() - self.origin))
+    def summary(self) -> str:
+        return ", ".join(f"{name} +{elapsed * 1000:.0f}ms" for name, elapsed in self.marks)
+
+def command_signature_hash(tree: app_commands.CommandTree) -> str:
+    """Hash of everything Discord stores about our slash commands; unchanged hash means nothing to sync."""
+    payload = []
+    for cmd in tree.walk_commands():
+        params = [(p.name, p.description, str(p.type), p.required, p.autocomplete, p.min_value, p.max_value,
+                   [(c.name, c.value) for c in p.choices]) for p in getattr(cmd, "parameters", ())]
+        payload.append((cmd.qualified_name, cmd.description, params))
+    payload.sort(key=lambda item: item[0])
+    return hashlib.sha256(json.dumps(payload, default=str).encode()).hexdigest()
+
+def shard_ids_for_worker(worker: int, workers: int, shard_count: int) -> list[int]:
+    return list(range(worker, shard_count, workers))
+
+class MusicBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    def __init__(self, *, shard_ids: Optional[list[int]] = None, shard_count: Optional[int] = None,
+                 sync_commands: bool = True, metrics_port: int = METRICS_PORT):
+        if SHARDED:
+            super().__init__(command_prefix="/", intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+        else:
+            super().__init__(command_prefix="/", intents=intents)
+        self.should_sync = sync_commands  # commands are global, so only one shard worker syncs them
+        self.metrics_port = metrics_port
+        self.metrics_runner: Optional[web.AppRunner] = None
+        self.http_session: Optional[aiohttp.ClientSession] = None  # shared connection pool, opened in setup_hook
+        self.lyrics = LyricsService(LyricsOvhProvider(LYRICS_API_URL), maxsize=LYRICS_CACHE_SIZE,
+                                    ttl=LYRICS_CACHE_TTL, negative_ttl=LYRICS_NEGATIVE_TTL,
+                                    path=LYRICS_CACHE_PATH or None)
+        self.timeline = StartupTimeline(_BOOT_STARTED)
+        self.timeline.mark("import")
+        metrics.add_collector(self.collect_metrics)
+    def collect_metrics(self):
+        yield "musicbot_lyrics_cache_hits", "Lyrics cache hits", [({}, self.lyrics.hits)]
+        yield "musicbot_lyrics_cache_misses", "Lyrics cache misses", [({}, self.lyrics.misses)]
+        if self.is_ready():
+            yield "musicbot_gateway_latency_seconds", "Discord gateway heartbeat latency", [({}, self.latency)]
     async def setup_hook(self):
+        # discord.py calls setup_hook right after logging in.
+        self.timeline.mark("login")
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=15))
+        if self.metrics_port:
+            self.metrics_runner = await metrics.start_server(METRICS_HOST, self.metrics_port)
+            log.info("Serving metrics on http://%s:%s/metrics", METRICS_HOST, self.metrics_port)
+        # Adding the cog registers all of its slash commands on the tree.
         await self.add_cog(Music(self))
+        if self.should_sync:
+            await self.sync_commands()
+    async def sync_commands(self):
+        """Sync the command tree only when its signature differs from the last successful sync."""
+        signature = command_signature_hash(self.tree)
+        hash_path = os.path.join(CACHE_DIR, f"commands-{self.application_id}.sha256")
+        try:
+            with open(hash_path) as f:
+                synced = f.read().strip()
+        except OSError:
+            synced = None
+        if synced == signature and not FORCE_SYNC:
+            self.timeline.mark("sync (skipped)")
+            return
         await self.tree.sync()
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(hash_path, "w") as f:
+            f.write(signature)
+        self.timeline.mark("sync")
+    async def close(self):
+        await super().close()
+        if self.http_session is not None:
+            await self.http_session.close()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        extraction_engine.shutdown()
+        extraction_cache.close()
+        self.lyrics.close()
+    async def on_ready(self):
+        print(f"Logged in as {self.user} (ID: {self.user.id})")
+        await self.change_presence(activity=discord.Game(name="Playing Music! Use /help"))
+        print("------")
+        if not any(name == "ready" for name, _ in self.timeline.marks):
+            self.timeline.mark("ready")
+            log.info("Startup timeline: %s", self.timeline.summary())
 
-bot = MusicBot()
+def run_shard_worker(worker: int, shard_ids: list[int], shard_count: int):
+    bot = MusicBot(shard_ids=shard_ids, shard_count=shard_count, sync_commands=worker == 0,
+                   metrics_port=METRICS_PORT + worker if METRICS_PORT else 0)
+    bot.run(TOKEN, root_logger=True)
 
-@bot.event
-async def on_ready():
-    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
-    await bot.change_presence(activity=discord.Game(name="Playing Music! Use /help"))
-    print("------")
+def run_sharded(workers: int, shard_count: int):
+    """Spread `shard_count` shards over `workers` processes and restart any worker that exits.
+    Guild state stays inside its shard's process; caches are shared through the SQLite file."""
+    discord.utils.setup_logging()  # the launcher never calls bot.run(), which would set this up
+    # spawn, not fork: each worker must open its own SQLite connections and thread pools.
+    ctx = multiprocessing.get_context("spawn")
+    def start(worker: int):
+        shard_ids = shard_ids_for_worker(worker, workers, shard_count)
+        process = ctx.Process(target=run_shard_worker, args=(worker, shard_ids, shard_count),
+                              name=f"shard-worker-{worker}")
+        process.start()
+        log.info("Started shard worker %d (pid %s) with shards %s", worker, process.pid, shard_ids)
+        return process
+    processes = {worker: start(worker) for worker in range(workers)}
+    try:
+        while True:
+            time.sleep(5)
+            for worker, process in processes.items():
+                if process.exitcode is not None:
+                    log.error("Shard worker %d exited with code %s, restarting", worker, process.exitcode)
+                    processes[worker] = start(worker)
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    if SHARD_WORKERS > 1:
+        if SHARD_COUNT is None:
+            raise SystemExit("SHARD_COUNT must be set when SHARD_WORKERS > 1.")
+        run_sharded(SHARD_WORKERS, SHARD_COUNT)
+    else:
+        bot = MusicBot(shard_count=SHARD_COUNT)
+        bot.run(TOKEN, root_logger=True)
@@ -0,0 +1,17 @@
+"""Helpers shared by the benchmark scripts."""
+import importlib.util
+import os
+import sys
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Caffine_&_Music.py")
+
+def load_bot_module():
+    """Import the bot script as a module without starting the bot."""
+    module = sys.modules.get("musicbot")
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location("musicbot", BOT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["musicbot"] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,473 @@
+"""Offline load test of the music cog: no Discord account, no YouTube.
+
+Usage: python benchmarks/loadtest.py [--guilds N] [--duration S] [--synthetic] [--json PATH]
+
+Stand-ins replace the three things the bot normally talks to:
+  * voice clients are threads that pull one frame every 20 ms from the bot's AudioSource, like
+    discord.py's AudioPlayer, and Opus-encode PCM frames when libopus is available;
+  * yt_dlp returns canned info dicts after a configurable delay, pointing at short tracks that FFmpeg
+    renders into a temporary directory (or at synthetic in-process sources with --synthetic, or when
+    FFmpeg is not installed);
+  * interactions record when they were first acknowledged and what was sent.
+Each simulated guild joins with /play and then issues a random mix of /play, /queue, /skip and
+/nowplaying. The report covers command throughput and latency percentiles, time to first audio,
+gaps between tracks, CPU per stream and memory per guild. --json writes the same numbers for
+comparison between runs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+# Keep the benchmark away from the on-disk caches, and lift the per-user and per-guild command rate limits,
+# which the simulated users would otherwise hit within seconds. Set RATE_* to measure the limits themselves;
+# everything else can still be tuned through the environment too.
+os.environ.setdefault("EXTRACT_CACHE_PATH", "")
+os.environ.setdefault("LYRICS_CACHE_PATH", "")
+os.environ.setdefault("METRICS_PORT", "0")
+for name in ("RATE_USER_BURST", "RATE_USER_PER_SECOND", "RATE_GUILD_BURST", "RATE_GUILD_PER_SECOND"):
+    os.environ.setdefault(name, "1000000000")
+
+from common import load_bot_module
+
+bot_module = load_bot_module()
+import discord
+
+FRAME_SECONDS = bot_module.FRAME_SECONDS
+
+# --- Voice --- #
+
+def make_encoder():
+    try:
+        return discord.opus.Encoder()
+    except discord.opus.OpusNotLoaded:
+        return None  # frames are still pulled in real time, just not encoded
+
+class FakeVoiceClient:
+    """Consumes the playing source in real time on its own thread, the way discord.py's AudioPlayer does."""
+    def __init__(self, channel, loop):
+        self.channel = channel
+        self.guild = channel.guild
+        self.loop = loop
+        self.encoder = make_encoder()
+        self._source = None
+        self._thread: threading.Thread = None
+        self._end = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._connected = True
+        self.frames = 0
+        self.first_frame_at = None  # perf_counter() of the first frame this client ever sent
+        self.startups: list[float] = []  # seconds from play() to the first frame of each source
+    @property
+    def source(self):
+        return self._source
+    @source.setter
+    def source(self, value):
+        self._source = value
+    def is_connected(self):
+        return self._connected
+    def is_playing(self):
+        return self._thread is not None and not self._end.is_set() and self._resumed.is_set()
+    def is_paused(self):
+        return self._thread is not None and not self._end.is_set() and not self._resumed.is_set()
+    def play(self, source, *, after=None):
+        if not self._connected:
+            raise discord.ClientException("Not connected to voice.")
+        if self.is_playing() or self.is_paused():
+            raise discord.ClientException("Already playing audio.")
+        self._source = source
+        self._end = threading.Event()
+        self._resumed.set()
+        self._thread = threading.Thread(target=self._run, args=(self._end, after, time.perf_counter()), daemon=True)
+        self._thread.start()
+    def _run(self, end: threading.Event, after, called_at: float):
+        error = None
+        started = False
+        source = self._source
+        next_at = time.perf_counter()
+        try:
+            while not end.is_set():
+                if not self._resumed.is_set():
+                    self._resumed.wait()
+                    next_at = time.perf_counter()
+                    continue
+                source = self._source
+                data = source.read()
+                if not data:
+                    break
+                if self.encoder is not None and not source.is_opus():
+                    self.encoder.encode(data, self.encoder.SAMPLES_PER_FRAME)
+                now = time.perf_counter()
+                if not started:
+                    started = True
+                    self.startups.append(now - called_at)
+                    if self.first_frame_at is None:
+                        self.first_frame_at = now
+                self.frames += 1
+                next_at += FRAME_SECONDS
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            end.set()
+            source.cleanup()  # a newer play() may already own self._source
+            if after is not None:
+                after(error)
+    def stop(self):
+        self._end.set()
+        self._resumed.set()
+    def pause(self):
+        self._resumed.clear()
+    def resume(self):
+        self._resumed.set()
+    async def move_to(self, channel):
+        self.channel = channel
+    async def disconnect(self, *, force=False):
+        self.stop()
+        self._connected = False
+        self.guild.voice_client = None
+    def join(self, timeout: float = 5):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+class FakeChannel:
+    def __init__(self, guild):
+        self.id = guild.id * 10
+        self.name = f"voice-{guild.id}"
+        self.guild = guild
+    def __str__(self):
+        return self.name
+    async def connect(self, **kwargs):
+        self.guild.voice_client = FakeVoiceClient(self, asyncio.get_running_loop())
+        return self.guild.voice_client
+
+# --- Interactions --- #
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        pass
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self.acked_at = None
+    def is_done(self):
+        return self.acked_at is not None
+    def _ack(self):
+        if self.acked_at is not None:
+            raise discord.InteractionResponded(self._interaction)
+        self.acked_at = time.perf_counter()
+    async def send_message(self, content=None, **kwargs):
+        self._ack()
+        self._interaction.sent.append(content if content is not None else kwargs.get("embed"))
+    async def defer(self, **kwargs):
+        self._ack()
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+    async def send(self, content=None, **kwargs):
+        self._interaction.sent.append(content if content is not None else kwargs.get("embed"))
+        return FakeMessage()
+
+class FakeInteraction:
+    def __init__(self, guild, user, command):
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.command = command
+        self.extras = {}
+        self.sent = []
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+def make_guild(guild_id: int):
+    guild = SimpleNamespace(id=guild_id, name=f"guild-{guild_id}", voice_client=None)
+    channel = FakeChannel(guild)
+    member = SimpleNamespace(id=guild_id * 100 + 1, display_name=f"listener-{guild_id}", mention=f"<@{guild_id}>",
+                             guild=guild, voice=SimpleNamespace(channel=channel))
+    return guild, member
+
+# --- Audio and extraction --- #
+
+SYNTHETIC_DURATIONS: dict[str, float] = {}
+
+class SyntheticPCM(discord.AudioSource):
+    """Stands in for FFmpegPCMAudio without a subprocess: the track's length in 20 ms frames of noise."""
+    FRAME = os.urandom(bot_module.FRAME_SAMPLES * 2)
+    def __init__(self, source, *, before_options=None, options=None, **kwargs):
+        match = re.search(r"-ss ([\d.]+)", before_options or "")
+        start = float(match.group(1)) if match else 0.0
+        self.remaining = max(0, int((SYNTHETIC_DURATIONS.get(source, 0) - start) / FRAME_SECONDS))
+    def read(self):
+        if self.remaining <= 0:
+            return b""
+        self.remaining -= 1
+        return self.FRAME
+    def is_opus(self):
+        return False
+    def cleanup(self):
+        self.remaining = 0
+
+class SyntheticOpus(SyntheticPCM):
+    FRAME = os.urandom(160)
+    def is_opus(self):
+        return True
+
+def render_tracks(directory: str, count: int, seconds: float) -> list[str]:
+    """Render short Opus tracks with FFmpeg's sine generator."""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"track{i}.opus")
+        subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-f", "lavfi",
+                        "-i", f"sine=frequency={220 + 55 * i}:duration={seconds}:sample_rate=48000",
+                        "-ac", "2", "-c:a", "libopus", "-b:a", "96k", path], check=True)
+        paths.append(path)
+    return paths
+
+def canned_tracks(paths: list[str], count: int, seconds: float) -> list[dict]:
+    tracks = []
+    for i in range(count):
+        tracks.append({
+            "id": f"bench{i:05d}",
+            "title": f"Bench Artist - Track {i}",
+            "uploader": "Bench Artist",
+            "duration": seconds,
+            "url": paths[i % len(paths)],
+            "webpage_url": f"https://www.youtube.com/watch?v=bench{i:05d}",
+            "acodec": "opus",
+        })
+    return tracks
+
+def fake_extractor(tracks: list[dict], latency: float):
+    """Replacement for _extract_in_worker: maps "... 17" or "...bench00017" to canned track 17."""
+    def extract(query: str, download: bool = False) -> dict:
+        if latency:
+            time.sleep(random.uniform(0.5, 1.5) * latency)
+        match = re.search(r"(\d+)$", query)
+        return dict(tracks[int(match.group(1)) % len(tracks) if match else 0])
+    return extract
+
+# --- Measurement --- #
+
+def summarize(values: list[float]) -> dict:
+    if not values:
+        return {"n": 0}
+    values = sorted(values)
+    def pick(p):
+        return values[min(len(values) - 1, int(p / 100 * len(values)))]
+    return {"n": len(values), "p50": pick(50), "p95": pick(95), "p99": pick(99), "max": values[-1]}
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def cpu_seconds() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+class Recorder:
+    def __init__(self):
+        self.ack: dict[str, list[float]] = {}
+        self.done: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.rejected = 0
+        self.ttfa: list[float] = []
+        self.loop_lag: list[float] = []
+    async def invoke(self, cog, name: str, guild, member, *args):
+        command = getattr(cog, name)
+        interaction = FakeInteraction(guild, member, command)
+        started = time.perf_counter()
+        try:
+            if not await cog.interaction_check(interaction):
+                self.rejected += 1
+                return interaction
+            await command.callback(cog, interaction, *args)
+            await cog.on_app_command_completion(interaction, command)
+        except discord.app_commands.CheckFailure:
+            self.rejected += 1
+            return interaction
+        except Exception as e:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            print(f"/{name} in guild {guild.id} raised {type(e).__name__}: {e}", file=sys.stderr)
+            return interaction
+        finished = time.perf_counter()
+        if interaction.response.acked_at is not None:
+            self.ack.setdefault(name, []).append(interaction.response.acked_at - started)
+        self.done.setdefault(name, []).append(finished - started)
+        return interaction
+    async def sample_loop_lag(self, interval: float = 0.05):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.perf_counter() - started - interval)
+
+async def drive_guild(cog, recorder: Recorder, guild, member, args, deadline: float, rng: random.Random):
+    started = time.perf_counter()
+    await recorder.invoke(cog, "play", guild, member, f"bench track {rng.randrange(args.tracks)}")
+    while time.perf_counter() < deadline:
+        voice = guild.voice_client
+        if voice is not None and voice.first_frame_at is not None and started is not None:
+            recorder.ttfa.append(voice.first_frame_at - started)
+            started = None
+        await asyncio.sleep(min(rng.expovariate(1 / args.think), max(0.0, deadline - time.perf_counter())))
+        if time.perf_counter() >= deadline:
+            break
+        state = cog.music_states.get(guild.id)
+        queued = len(state.queue) if state is not None else 0
+        name = rng.choices(("play", "queue", "skip", "nowplaying"), weights=args.mix)[0]
+        if name == "play" and queued >= args.max_queue:
+            name = "queue"
+        if name == "play":
+            await recorder.invoke(cog, name, guild, member, f"bench track {rng.randrange(args.tracks)}")
+        elif name == "queue":
+            await recorder.invoke(cog, name, guild, member, 1)
+        else:
+            await recorder.invoke(cog, name, guild, member)
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="musicbot-loadtest-")
+    synthetic = args.synthetic or shutil.which("ffmpeg") is None
+    try:
+        if synthetic:
+            paths = [os.path.join(workdir, f"synthetic{i}") for i in range(8)]
+            for path in paths:
+                SYNTHETIC_DURATIONS[path] = args.track_seconds
+            discord.FFmpegPCMAudio = SyntheticPCM
+            discord.FFmpegOpusAudio = SyntheticOpus
+        else:
+            paths = render_tracks(workdir, min(args.tracks, 8), args.track_seconds)
+        bot_module._extract_in_worker = fake_extractor(canned_tracks(paths, args.tracks, args.track_seconds),
+                                                       args.extract_latency)
+        bot = bot_module.MusicBot(sync_commands=False, metrics_port=0)
+        bot.loop = asyncio.get_running_loop()
+        cog = bot_module.Music(bot)
+        recorder = Recorder()
+        lag_task = asyncio.create_task(recorder.sample_loop_lag())
+        guilds = [make_guild(1000 + i) for i in range(args.guilds)]
+        rss_before = rss_bytes()
+        cpu_before = cpu_seconds()
+        wall_before = time.perf_counter()
+        deadline = wall_before + args.duration
+        rng = random.Random(args.seed)
+        drivers = []
+        for guild, member in guilds:
+            drivers.append(asyncio.create_task(drive_guild(cog, recorder, guild, member, args, deadline,
+                                                           random.Random(rng.random()))))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / args.guilds)
+        await asyncio.gather(*drivers)
+        wall = time.perf_counter() - wall_before
+        stats = cog.stats()
+        rss_after = rss_bytes()
+        states = list(cog.music_states.values())
+        voices = [guild.voice_client for guild, _ in guilds if guild.voice_client is not None]
+        for state in states:
+            await cog.evict(state)
+        for voice in voices:
+            voice.join()
+        cpu = cpu_seconds() - cpu_before
+        lag_task.cancel()
+        frames = sum(voice.frames for voice in voices)
+        stream_seconds = frames * FRAME_SECONDS
+        commands = sum(len(v) for v in recorder.done.values())
+        result = {
+            "config": {"guilds": args.guilds, "duration": args.duration, "tracks": args.tracks,
+                       "track_seconds": args.track_seconds, "extract_latency": args.extract_latency,
+                       "audio": "synthetic" if synthetic else "ffmpeg", "opus_encode": discord.opus.is_loaded()},
+            "throughput": {"commands_per_second": commands / wall, "frames_per_second": frames / wall,
+                           "stream_seconds": stream_seconds},
+            "command_ack_seconds": {name: summarize(v) for name, v in sorted(recorder.ack.items())},
+            "command_done_seconds": {name: summarize(v) for name, v in sorted(recorder.done.items())},
+            "command_errors": recorder.errors,
+            "commands_rejected": recorder.rejected,
+            "time_to_first_audio_seconds": summarize(recorder.ttfa),
+            "transition_gap_seconds": summarize([gap for st in states for gap in st.transition_gaps]),
+            "source_startup_seconds": summarize([s for voice in voices for s in voice.startups]),
+            "event_loop_lag_seconds": summarize(recorder.loop_lag),
+            "cpu": {"seconds": cpu, "core_percent_per_stream": 100 * cpu / stream_seconds if stream_seconds else None},
+            "memory": {"state_bytes_per_guild": stats["state_bytes"] / max(1, stats["active_guilds"]),
+                       "rss_bytes_per_guild": (rss_after - rss_before) / args.guilds
+                       if rss_before is not None and rss_after is not None else None},
+        }
+        bot_module.extraction_engine.shutdown()
+        await bot.close()
+        return result
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def print_report(result: dict):
+    config = result["config"]
+    print(f"{config['guilds']} guilds for {config['duration']}s, {config['audio']} audio, "
+          f"opus encode {'on' if config['opus_encode'] else 'off (libopus not found)'}")
+    throughput = result["throughput"]
+    print(f"throughput: {throughput['commands_per_second']:.1f} commands/s, "
+          f"{throughput['frames_per_second']:.0f} frames/s, {throughput['stream_seconds']:.0f} stream-seconds")
+    def row(label, summary):
+        if not summary.get("n"):
+            print(f"  {label:<22} n=0")
+            return
+        print(f"  {label:<22} n={summary['n']:<6} p50={summary['p50'] * 1000:8.2f}ms "
+              f"p95={summary['p95'] * 1000:8.2f}ms p99={summary['p99'] * 1000:8.2f}ms max={summary['max'] * 1000:8.2f}ms")
+    print("command latency (first response):")
+    for name, summary in result["command_ack_seconds"].items():
+        row(f"/{name}", summary)
+    print("command latency (handler done):")
+    for name, summary in result["command_done_seconds"].items():
+        row(f"/{name}", summary)
+    print("playback:")
+    row("time to first audio", result["time_to_first_audio_seconds"])
+    row("transition gap", result["transition_gap_seconds"])
+    row("source startup", result["source_startup_seconds"])
+    row("event loop lag", result["event_loop_lag_seconds"])
+    cpu = result["cpu"]
+    per_stream = cpu["core_percent_per_stream"]
+    print(f"cpu: {cpu['seconds']:.2f}s total, "
+          + (f"{per_stream:.2f}% of a core per stream" if per_stream is not None else "no audio streamed"))
+    memory = result["memory"]
+    rss = memory["rss_bytes_per_guild"]
+    print(f"memory: {memory['state_bytes_per_guild'] / 1024:.1f} KiB guild state per guild"
+          + (f", {rss / 1024:.1f} KiB RSS growth per guild" if rss is not None else ""))
+    if result["command_errors"] or result["commands_rejected"]:
+        print(f"errors: {result['command_errors']}, rejected: {result['commands_rejected']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic")
+    parser.add_argument("--tracks", type=int, default=200, help="distinct canned tracks")
+    parser.add_argument("--track-seconds", type=float, default=8)
+    parser.add_argument("--extract-latency", type=float, default=0.3, help="mean simulated yt_dlp seconds")
+    parser.add_argument("--think", type=float, default=2.0, help="mean seconds between a guild's commands")
+    parser.add_argument("--mix", type=float, nargs=4, default=(4, 3, 1, 2), metavar=("PLAY", "QUEUE", "SKIP", "NP"),
+                        help="relative weights of /play, /queue, /skip and /nowplaying")
+    parser.add_argument("--max-queue", type=int, default=20, help="guilds stop adding songs past this queue length")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which guilds join")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--synthetic", action="store_true", help="in-process audio instead of FFmpeg")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Micro-benchmark of the per-frame volume paths.
+
+Usage: python benchmarks/volume.py [frames]
+
+Reports microseconds per 20 ms frame for each PCMScaler backend and for discord.py's
+PCMVolumeTransformer, plus how many concurrent streams one core could scale at that cost.
+Expect the backends and PCMVolumeTransformer to land within a few microseconds of each other;
+only the unity-gain bypass is substantially cheaper.
+Passing the gain to FFmpeg (-af volume=...) moves this work out of the bot process entirely.
+"""
+import os
+import sys
+import time
+
+from common import load_bot_module
+
+def bench(scale, frames: list[bytes]) -> float:
+    start = time.perf_counter()
+    for frame in frames:
+        scale(frame)
+    return (time.perf_counter() - start) / len(frames)
+
+def main():
+    bot = load_bot_module()
+    import discord
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    frames = [os.urandom(bot.FRAME_SAMPLES * 2) for _ in range(64)] * (count // 64 + 1)
+    frames = frames[:count]
+    results = {}
+    for backend in ("numpy", "audioop"):
+        try:
+            scaler = bot.PCMScaler(backend)
+        except RuntimeError:
+            print(f"{backend:>22}: unavailable")
+            continue
+        results[backend] = bench(lambda f: scaler.scale(f, 0.5), frames)
+    unity = bot.PCMScaler()
+    results["unity gain"] = bench(lambda f: unity.scale(f, 1.0), frames)
+    class FrameSource(discord.AudioSource):
+        def __init__(self, frames):
+            self._frames = iter(frames)
+        def read(self):
+            return next(self._frames, b"")
+    transformer = discord.PCMVolumeTransformer(FrameSource(frames), volume=0.5)
+    results["PCMVolumeTransformer"] = bench(lambda f: transformer.read(), frames)
+    for name, seconds in results.items():
+        per_core = bot.FRAME_SECONDS / seconds if seconds else float("inf")
+        print(f"{name:>22}: {seconds * 1e6:8.1f} us/frame  ~{per_core:,.0f} streams/core")
+
+if __name__ == "__main__":
+    main()
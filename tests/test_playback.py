@@ -0,0 +1,67 @@
+"""Player behaviour against the load test's fake voice client, synthetic audio and fake yt_dlp."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import loadtest as lt  # noqa: E402
+
+bot_module = lt.bot_module
+
+def run(seconds: float, **env):
+    """Run `test(cog, guild, member)` with two canned tracks of `seconds` each."""
+    def decorator(test):
+        def wrapper(monkeypatch):
+            monkeypatch.setattr(lt.discord, "FFmpegPCMAudio", lt.SyntheticPCM)
+            monkeypatch.setattr(lt.discord, "FFmpegOpusAudio", lt.SyntheticOpus)
+            monkeypatch.setitem(lt.SYNTHETIC_DURATIONS, "track", seconds)
+            monkeypatch.setattr(bot_module, "_extract_in_worker",
+                                lt.fake_extractor(lt.canned_tracks(["track"], 2, seconds), 0.0))
+            async def main():
+                bot = bot_module.MusicBot(sync_commands=False, metrics_port=0)
+                bot.loop = asyncio.get_running_loop()
+                cog = bot_module.Music(bot)
+                guild, member = lt.make_guild(1)
+                guild.get_member = lambda user_id: None
+                try:
+                    await test(cog, guild, member)
+                finally:
+                    if 1 in cog.music_states:
+                        await cog.evict(cog.music_states[1])
+                    await asyncio.sleep(0.1)  # let the player thread run its after-callback on a live loop
+            asyncio.run(main())
+        return wrapper
+    return decorator
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+async def play_both(cog, guild, member):
+    recorder = lt.Recorder()
+    await recorder.invoke(cog, "play", guild, member, "track 0")
+    await recorder.invoke(cog, "play", guild, member, "track 1")
+    state = cog.music_states[1]
+    await wait_for(lambda: state.current is not None and state.is_playing())
+    return state, recorder
+
+@run(seconds=60)
+async def test_skip_under_song_loop_moves_on(cog, guild, member):
+    state, recorder = await play_both(cog, guild, member)
+    first = state.current
+    state.loop = "song"
+    await recorder.invoke(cog, "skip", guild, member)
+    await wait_for(lambda: state.current is not None and state.current is not first and state.is_playing())
+    assert state.current.title() == "Bench Artist - Track 1"
+    assert first not in list(state.queue)
+
+@run(seconds=0.3)
+async def test_song_loop_replays_the_current_song(cog, guild, member):
+    state, _ = await play_both(cog, guild, member)
+    first = state.current
+    state.loop = "song"
+    await asyncio.sleep(0.8)  # two more passes of the 0.3 s track
+    assert state.current is first
+    assert [song.title() for song in state.queue] == ["Bench Artist - Track 1"]
@@ -0,0 +1,20 @@
+"""How run_sharded() spreads shards over worker processes."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from common import load_bot_module  # noqa: E402
+
+bot_module = load_bot_module()
+
+@pytest.mark.parametrize("workers, shard_count", [(1, 1), (2, 4), (3, 10), (4, 3)])
+def test_every_shard_runs_in_exactly_one_worker(workers, shard_count):
+    assigned = [bot_module.shard_ids_for_worker(worker, workers, shard_count) for worker in range(workers)]
+    flat = [shard for shard_ids in assigned for shard in shard_ids]
+    assert sorted(flat) == list(range(shard_count))
+
+def test_workers_get_an_even_share():
+    sizes = [len(bot_module.shard_ids_for_worker(worker, 3, 16)) for worker in range(3)]
+    assert max(sizes) - min(sizes) <= 1